@@ -0,0 +1,153 @@
+#! /usr/bin/env python2.7
+
+import CreditNetworks as CN
+import Simulator
+
+from argparse import ArgumentParser
+from itertools import product
+from time import time
+import json
+import sys
+
+
+PHASES = ["matrices", "social_network", "strategies", "network", "defaults", \
+		"transactions"]
+CASE_KEYS = ["agents", "events", "social_network", "num_banks", "strategies"]
+
+
+def parse_args():
+	parser = ArgumentParser(description="Time each phase of the simulation " \
+			"pipeline over a grid of cases, all run from the same seeds.")
+	parser.add_argument("--config", type=str, default="defaults.json", \
+			help="json file whose configuration block the cases start from")
+	parser.add_argument("--agents", type=int, nargs="+", default=[20, 50])
+	parser.add_argument("--events", type=int, nargs="+", default=[10000])
+	parser.add_argument("--social-networks", type=str, nargs="+", \
+			default=["ErdosRenyiGraph"])
+	parser.add_argument("--num-banks", type=int, nargs="+", default=[0])
+	parser.add_argument("--strategies", type=str, nargs="+", default=[ \
+			"BuyRate_highest2_get2", "DefProb_lowest2_get2+all0"], \
+			help="strategy mixes; '+' separated strategies are assigned to " \
+			"agents in turn")
+	parser.add_argument("--repeats", type=int, default=3)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", type=str, default=None, help="file to " \
+			"write results to (default: stdout); usable later as a baseline")
+	parser.add_argument("--baseline", type=str, default=None, help="results " \
+			"of an earlier run to check for regressions")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="flag " \
+			"phases whose median time grew by more than this fraction")
+	parser.add_argument("--min-seconds", type=float, default=0.005, help= \
+			"ignore slowdowns smaller than this many seconds")
+	return parser.parse_args()
+
+
+def case_parameters(config, case):
+	parameters = Simulator.parse_config(config)
+	mix = case["strategies"].split("+")
+	parameters["role"] = "All"
+	parameters["strategies"] = [mix[i % len(mix)] for i in \
+			range(case["agents"])]
+	parameters["events"] = case["events"]
+	parameters["social_network"] = case["social_network"]
+	parameters["num_banks"] = case["num_banks"]
+	return parameters
+
+
+def time_simulation(parameters):
+	"""Run one simulation, returning the seconds spent in each phase."""
+	stamps = [time()]
+	matrices = CN.InitMatrices(parameters)
+	stamps.append(time())
+	social_network = CN.InitSocialNetwork(parameters)
+	stamps.append(time())
+	edges = CN.InitEdges(matrices, social_network, parameters)
+	stamps.append(time())
+	crednet = CN.BuildCrednet(edges, parameters)
+	stamps.append(time())
+	payoffs = dict([(n,0.) for n in crednet.nodes])
+	defaulters = CN.DrawDefaulters(crednet, parameters, matrices["DP"])
+	CN.RemoveDefaulters(crednet, payoffs, defaulters)
+	stamps.append(time())
+	CN.SimulateTransactions(crednet, parameters, payoffs, matrices["TR"], \
+			matrices["BV"], matrices["SC"])
+	stamps.append(time())
+	return dict(zip(PHASES, [b - a for a, b in zip(stamps, stamps[1:])]))
+
+
+def median(values):
+	values = sorted(values)
+	mid = len(values) / 2
+	if len(values) % 2:
+		return values[mid]
+	return (values[mid-1] + values[mid]) / 2.
+
+
+def run_case(config, case, repeats, seed):
+	"""
+	Time a case <repeats> times; repeat r of every case uses the same seed.
+	"""
+	parameters = case_parameters(config, case)
+	runs = []
+	for r in range(repeats):
+		Simulator.seed_simulation(seed, 0, r)
+		runs.append(time_simulation(parameters))
+	result = dict(case)
+	result["phases"] = dict([(phase, {"min":min([run[phase] for run in \
+			runs]), "median":median([run[phase] for run in runs])}) for \
+			phase in PHASES])
+	result["total"] = median([sum(run.values()) for run in runs])
+	return result
+
+
+def case_key(case):
+	return tuple(case[key] for key in CASE_KEYS)
+
+
+def find_regressions(results, baseline, tolerance, min_seconds):
+	"""List phases whose median time grew past tolerance since baseline."""
+	old_cases = dict([(case_key(case), case) for case in baseline["cases"]])
+	regressions = []
+	for case in results["cases"]:
+		if case_key(case) not in old_cases:
+			continue
+		for phase in PHASES:
+			old = old_cases[case_key(case)]["phases"][phase]["median"]
+			new = case["phases"][phase]["median"]
+			if new > old * (1 + tolerance) and new - old > min_seconds:
+				regression = dict([(key, case[key]) for key in CASE_KEYS])
+				regression.update({"phase":phase, "baseline":old, "median":new})
+				regressions.append(regression)
+	return regressions
+
+
+def main():
+	args = parse_args()
+	with open(args.config) as f:
+		config = json.load(f)["configuration"]
+	results = {"seed":args.seed, "repeats":args.repeats, "cases":[]}
+	for values in product(args.agents, args.events, args.social_networks, \
+			args.num_banks, args.strategies):
+		case = dict(zip(CASE_KEYS, values))
+		results["cases"].append(run_case(config, case, args.repeats, \
+				args.seed))
+		print >> sys.stderr, " ".join(map(str, values)), "%.3fs" % \
+				results["cases"][-1]["total"]
+	if args.baseline is not None:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		results["regressions"] = find_regressions(results, baseline, \
+				args.tolerance, args.min_seconds)
+		for r in results["regressions"]:
+			print >> sys.stderr, "REGRESSION", r
+	if args.output is None:
+		json.dump(results, sys.stdout, indent=2)
+	else:
+		with open(args.output, "w") as f:
+			json.dump(results, f, indent=2)
+	if results.get("regressions"):
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,10 +1,22 @@
-from Graphs.Graphs import WeightedDirectedGraph, PathError
+from Graphs.Graphs import WeightedDirectedGraph, PathError, tracePath
+import Graphs.Graphs as G
 import Graphs.GraphGenerators as GG
 from Strategies import AgentStrategies, BankPolicies
 
-from numpy import array, fill_diagonal
+from numpy import array, fill_diagonal, zeros, ones, unique, bincount, \
+		concatenate, cumsum, flatnonzero, int64, arange, full, where, minimum, \
+		maximum, logical_or, repeat, tile, packbits, min_scalar_type
 import numpy.random as R
+import numpy
+import random
 from random import choice
+from itertools import chain
+from collections import Counter
+from sys import modules
+from time import time
+from copy import copy as shallowCopy
+import json
+import os
 
 
 class CreditError(Exception):
@@ -12,9 +24,360 @@ class CreditError(Exception):
 		Exception.__init__(self, 'insufficient credit')
 
 
+class ReadOnlyError(Exception):
+	def __init__(self):
+		Exception.__init__(self, 'network was loaded read-only; change a ' \
+				'fork() of it instead')
+
+
+class ReachabilityIndex:
+	"""
+	Which nodes of a graph can reach which, as an over-approximation.
+
+	Nodes are grouped into strongly connected components, and reach[c] is a
+	bitmask of the components that component c reaches. Adding an edge
+	updates the masks exactly. Removing one can only shrink reachability, so
+	it is ignored and the masks may claim paths that are gone. A negative
+	answer from reaches is therefore always right. Positive answers that
+	turn out wrong are reported by miss(); after <limit> of them, or after
+	invalidate() (as when a node is added), the next query rebuilds the
+	index. The limit starts at <patience> and doubles whenever the index
+	answered no query negatively since it was last built, and returns to
+	<patience> otherwise.
+	"""
+	patience = 8
+
+	def __init__(self, graph):
+		self.graph = graph
+		self.component = None
+		self.reach = None
+		self.misses = 0
+		self.rejections = 0
+		self.limit = self.patience
+
+	def invalidate(self):
+		self.component = None
+
+	def miss(self):
+		self.misses += 1
+		if self.misses >= self.limit:
+			self.invalidate()
+
+	def reaches(self, src, dst):
+		if self.component is None:
+			if self.reach is not None and self.rejections == 0:
+				self.limit *= 2
+			elif self.rejections > 0:
+				self.limit = self.patience
+			self.misses = self.rejections = 0
+			self._build()
+		if self.reach[self.component[src]] >> self.component[dst] & 1:
+			return True
+		self.rejections += 1
+		return False
+
+	def addEdge(self, src, dst):
+		if self.component is None:
+			return
+		if src not in self.component or dst not in self.component:
+			self.invalidate()
+			return
+		cs, cd = self.component[src], self.component[dst]
+		if self.reach[cs] >> cd & 1:
+			return
+		bit, gained = 1 << cs, self.reach[cd]
+		self.reach = [r | gained if r & bit else r for r in self.reach]
+
+	def _build(self):
+		"""
+		Find components by Tarjan's algorithm, which emits each component
+		after every component it reaches, so masks are built in one pass.
+		"""
+		graph = self.graph
+		order = {}
+		low = {}
+		stack = []
+		self.component = {}
+		self.reach = []
+		for root in graph.nodes:
+			if root in order:
+				continue
+			order[root] = low[root] = len(order)
+			stack.append(root)
+			calls = [(root, iter(graph.neighbors(root)))]
+			while calls:
+				node, neighbors = calls[-1]
+				for neighbor in neighbors:
+					if neighbor not in order:
+						order[neighbor] = low[neighbor] = len(order)
+						stack.append(neighbor)
+						calls.append((neighbor, iter(graph.neighbors(neighbor))))
+						break
+					if neighbor not in self.component:
+						low[node] = min(low[node], order[neighbor])
+				else:
+					calls.pop()
+					if calls:
+						parent = calls[-1][0]
+						low[parent] = min(low[parent], low[node])
+					if low[node] == order[node]:
+						self._emit(node, stack)
+
+	def _emit(self, root, stack):
+		c = len(self.reach)
+		members = []
+		while not members or members[-1] != root:
+			members.append(stack.pop())
+			self.component[members[-1]] = c
+		mask = 1 << c
+		for node in members:
+			for neighbor in self.graph.neighbors(node):
+				if self.component[neighbor] != c:
+					mask |= self.reach[self.component[neighbor]]
+		self.reach.append(mask)
+
+
 class CreditNetwork(WeightedDirectedGraph):
-	def __init__(self, nodes=[], weightedEdges=[]):
+	touchedLimit = 1 << 16
+	readOnly = False
+
+	def __init__(self, nodes=[], weightedEdges=[], routing="augmentPayment", \
+			search="bfsPath", reachability=False, hubs=None, pathCache=False):
+		self.journal = None
+		self.marks = []
+		self.reachability = None
+		self.hubs = None
+		self.pathCache = None
+		self.touched = []
+		self.lastTouched = {}
 		WeightedDirectedGraph.__init__(self, nodes, weightedEdges)
+		self.routing = routing
+		self.search = search
+		if reachability:
+			self.reachability = ReachabilityIndex(self)
+		self.setHubs(hubs)
+		self.setPathCache(pathCache)
+
+	def addEdge(self, src, dst, weight):
+		if self.journal is not None:
+			self._record(src, dst)
+		self._setEdge(src, dst, weight)
+
+	def removeEdge(self, src, dst):
+		if self.journal is not None:
+			self._record(src, dst)
+		self._clearEdge(src, dst)
+
+	def addNode(self, node):
+		WeightedDirectedGraph.addNode(self, node)
+		if self.reachability is not None:
+			self.reachability.invalidate()
+		self.setHubs(self.hubs)
+
+	def removeNode(self, node):
+		assert self.journal is None, "node removal cannot be journaled"
+		WeightedDirectedGraph.removeNode(self, node)
+		self._dropHub(node)
+		self._clearPathCache()
+
+	def setHubs(self, hubs):
+		"""
+		Before searching for a path, try the direct edge and then each of the
+		given hub nodes in turn (see hubPath). hubs may be "detect" to use
+		findHubs, or None to always search.
+
+		Hubs are tried in node order, so a path through the first hub that
+		completes one is the path bfsPath would find only if the hubs sort
+		before every other node, as banks (negative nodes) do. Hubs that do
+		not are dropped.
+		"""
+		if hubs == "detect":
+			hubs = self.findHubs()
+		if hubs is None:
+			self.hubs = None
+			return
+		spokes = self.nodes - set(hubs)
+		self.hubs = sorted([h for h in hubs if h in self.nodes and (not \
+				spokes or h < min(spokes))])
+
+	def findHubs(self):
+		"""
+		Find the largest set of at most half the nodes in which each node has
+		credit edges to and from every node outside the set, as the banks of
+		an agentsk_banksc policy do. Returns [] if there is none.
+		"""
+		bound = dict([(n, min(self.degree(n), len(self.predecessors(n)))) for \
+				n in self.nodes])
+		ranked = sorted(self.nodes, key=lambda n: (-bound[n], n))
+		for size in range(len(ranked) / 2, 0, -1):
+			hubs = ranked[:size]
+			if bound[hubs[-1]] < len(ranked) - size:
+				continue
+			spokes = self.nodes - set(hubs)
+			if all([spokes <= set(self.neighbors(h)) and spokes <= \
+					set(self.predecessors(h)) for h in hubs]):
+				return hubs
+		return []
+
+	def hubPath(self, origin, destination, present=None):
+		"""
+		The path from origin to destination that bfsPath would find, if it is
+		the direct edge or runs through a hub; otherwise None.
+
+		present(src, dst) tells whether an edge exists (default: adjacent).
+		"""
+		if present is None:
+			present = self.adjacent
+		if present(origin, destination):
+			return [origin, destination]
+		for hub in self.hubs:
+			if present(origin, hub) and present(hub, destination):
+				return [origin, hub, destination]
+		return None
+
+	def _dropHub(self, node):
+		if self.hubs is not None and node in self.hubs:
+			self.hubs = [h for h in self.hubs if h != node]
+
+	def setPathCache(self, enabled):
+		"""
+		Remember the last path found from each origin to each destination,
+		and reuse it while bfsPath would still find it (see _cachedPath).
+		"""
+		assert not enabled or self.search == "bfsPath", \
+				"the path cache needs bfsPath search"
+		self.pathCache = {} if enabled else None
+
+	def _clearPathCache(self):
+		if self.pathCache is not None:
+			self.pathCache.clear()
+			del self.touched[:]
+			self.lastTouched.clear()
+
+	def fork(self):
+		"""
+		Return an independent copy of the network, for a run that must not
+		change this one. Stats and caches are not copied.
+		"""
+		assert self.journal is None, "cannot fork inside a transaction"
+		fork = self._copy()
+		fork.stats = None
+		if self.reachability is not None:
+			fork.reachability = ReachabilityIndex(fork)
+		fork.touched = []
+		fork.lastTouched = {}
+		if self.pathCache is not None:
+			fork.pathCache = {}
+		return fork
+
+	def _copy(self):
+		copy = shallowCopy(self)
+		copy.marks = []
+		copy.nodes = set(self.nodes)
+		copy.edges = dict((n, set(s)) for n, s in self.edges.iteritems())
+		copy.inEdges = dict((n, set(s)) for n, s in self.inEdges.iteritems())
+		copy.weights = dict(self.weights)
+		copy.distanceCache = dict()
+		return copy
+
+	def save(self, directory):
+		"""Write the network to directory; LoadCrednet reads it back."""
+		edges = self.allEdges()
+		numpy.save(os.path.join(directory, "nodes.npy"), array(sorted( \
+				self.nodes), dtype=int64))
+		numpy.save(os.path.join(directory, "edges.npy"), array([e[:2] for e \
+				in edges], dtype=int64).reshape(-1, 2))
+		numpy.save(os.path.join(directory, "weights.npy"), array([e[2] for e \
+				in edges], dtype=float))
+		self._saveSettings(directory)
+
+	def _settings(self):
+		return {"class":self.__class__.__name__, "routing":self.routing, \
+				"search":self.search, "reachability":self.reachability is \
+				not None, "hubs":self.hubs, "pathCache":self.pathCache is \
+				not None}
+
+	def _saveSettings(self, directory):
+		with open(os.path.join(directory, "network.json"), "w") as f:
+			json.dump(self._settings(), f)
+
+	def _setEdge(self, src, dst, weight):
+		if self.reachability is not None:
+			self.reachability.addEdge(src, dst)
+		if not self.adjacent(src, dst):
+			self._touch(src)
+		WeightedDirectedGraph.addEdge(self, src, dst, weight)
+
+	def _touch(self, node):
+		"""
+		Log that an edge out of node has appeared, for the path cache (see
+		_cachedPath). A log grown past touchedLimit is dropped with the cache.
+		"""
+		if self.pathCache is None:
+			return
+		if len(self.touched) >= self.touchedLimit:
+			self._clearPathCache()
+		self.lastTouched[node] = len(self.touched)
+		self.touched.append(node)
+
+	def _clearEdge(self, src, dst):
+		WeightedDirectedGraph.removeEdge(self, src, dst)
+
+	def begin(self):
+		"""
+		Start a transaction; changes to edges are journaled until it ends.
+
+		Transactions nest: an inner rollback undoes only the changes made
+		since the matching begin.
+		"""
+		if self.journal is None:
+			self.journal = []
+		self.marks.append(len(self.journal))
+
+	def commit(self):
+		"""Keep the changes made in the current transaction."""
+		self.marks.pop()
+		if not self.marks:
+			self.journal = None
+
+	def rollback(self):
+		"""
+		Undo the changes made in the current transaction, newest first.
+
+		This costs O(changes) and restores the exact prior edge weights.
+		"""
+		mark = self.marks.pop()
+		journal, self.journal = self.journal, None
+		while len(journal) > mark:
+			self._restore(*journal.pop())
+		if self.marks:
+			self.journal = journal
+
+	def _record(self, src, dst):
+		"""Journal the current weight of edge (src, dst), None if absent."""
+		if self.adjacent(src, dst):
+			self.journal.append((src, dst, self.edgeWeight(src, dst)))
+		else:
+			self.journal.append((src, dst, None))
+
+	def _restore(self, src, dst, weight):
+		if weight is not None:
+			self._setEdge(src, dst, weight)
+		elif self.adjacent(src, dst):
+			self._clearEdge(src, dst)
+
+	def probePayment(self, sender, receiver, amount):
+		"""
+		Report whether routePayment would succeed, leaving the network as is.
+		"""
+		self.begin()
+		try:
+			self.routePayment(sender, receiver, amount)
+			return True
+		except CreditError:
+			return False
+		finally:
+			self.rollback()
 
 	def capacity(self, path):
 		"""
@@ -30,6 +393,28 @@ class CreditNetwork(WeightedDirectedGraph):
 			minCapacity = min(minCapacity, self.weights[(src, dst)])
 		return minCapacity
 
+	def flowBound(self, origin, destination):
+		"""
+		Upper bound on the flow from origin to destination: the lesser of the
+		credit out of origin and the credit into destination.
+		"""
+		return min(sum([self.weights[(origin, n)] for n in \
+				self.edges[origin]]), sum([self.weights[(n, destination)] for \
+				n in self.inEdges[destination]]))
+
+	def feasible(self, sender, receiver, amount):
+		"""
+		Report whether a payment might succeed, without searching.
+
+		False means routePayment would certainly fail: the receiver cannot
+		reach the sender, or has too little credit flowing out (or the sender
+		in) to carry amount. The bound allows for rounding in the sums.
+		"""
+		if self.reachability is not None and \
+				not self.reachability.reaches(receiver, sender):
+			return False
+		return self.flowBound(receiver, sender) >= amount * (1 - 1e-9)
+
 	def makePayment(self, sender, receiver, amount):
 		"""
 		Transfer an IOU for <amount> from <sender> to connected <receiver>.
@@ -44,13 +429,16 @@ class CreditNetwork(WeightedDirectedGraph):
 		if not self.adjacent(receiver, sender) or \
 				self.weights[receiver, sender] < amount:
 			raise CreditError()
+		if self.journal is not None:
+			self._record(sender, receiver)
+			self._record(receiver, sender)
 		if not self.adjacent(sender, receiver):
-			self.addEdge(sender, receiver, amount)
+			self._setEdge(sender, receiver, amount)
 		else:
 			self.weights[(sender, receiver)] += amount
 		self.weights[(receiver, sender)] -= amount
 		if self.weights[(receiver, sender)] == 0:
-			self.removeEdge(receiver, sender)
+			self._clearEdge(receiver, sender)
 
 	def routePayment(self, sender, receiver, amount):
 		"""
@@ -58,68 +446,1383 @@ class CreditNetwork(WeightedDirectedGraph):
 
 		There must be directed paths from reciever to sender with total capacity
 		of at least amount. If not, a CreditError is raised.
+
+		The work is done by the method named by self.routing: augmentPayment,
+		or flowPayment, which checks with one max-flow search that a payment
+		needing several paths can be paid before writing anything. Both
+		accept the same payments, pay them along the same paths and leave
+		the network untouched when a payment fails. With
+		hubs set (see setHubs), direct and hub paths are found without a
+		search, and with the path cache set (see setPathCache) augmentPayment
+		reuses each pair's last path while it is still valid.
+
+		If self.reachability is a ReachabilityIndex, or hubs are set, payments
+		that cannot be feasible are rejected before any search: in a hub
+		network most payments either go through a hub or fail for want of
+		credit at one end, which the flow bound shows.
+		"""
+		if self.readOnly:
+			raise ReadOnlyError()
+		if (self.reachability is not None or self.hubs is not None) and \
+				not self.feasible(sender, receiver, amount):
+			if self.stats is not None:
+				self.stats["rejected_payments"] += 1
+				self._countPayment(0, True, False)
+			raise CreditError()
+		return getattr(self, self.routing)(sender, receiver, amount)
+
+	def augmentPayment(self, sender, receiver, amount):
+		"""
+		Route a payment by paying along shortest paths until it is complete.
+
+		Once a path leaves part of the payment unpaid, the payment runs as a
+		transaction; if the paths run out, the partial payment is rolled back
+		before the CreditError is raised. A payment settled by its first path
+		(as through a hub) cannot fail, so it is not journaled.
 		"""
 		remaining = amount
-		while remaining > 0:
-			try:
-				path = self.shortestPath(receiver, sender)
-			except PathError:
-				self.routePayment(receiver, sender, amount - remaining)
-				raise CreditError()
-			capacity = self.capacity(path)
+		augmentations = 0
+		transaction = False
+		try:
+			while remaining > 0:
+				try:
+					path = self._fewestHops(receiver, sender)
+				except PathError:
+					if augmentations == 0:
+						self._unreachable()
+					raise CreditError()
+				augmentations += 1
+				if self.stats is not None:
+					self.stats[("path_lengths", len(path) - 1)] += 1
+				capacity = self.capacity(path)
+				if capacity < remaining and not transaction:
+					self.begin()
+					transaction = True
+				for src, dst in zip(path[1:], path):
+					self.makePayment(src, dst, min(capacity, remaining))
+				remaining = max(remaining - capacity, 0)
+		except Exception:
+			if transaction:
+				self.rollback()
+			if self.stats is not None:
+				self._countPayment(augmentations, True, augmentations > 0)
+			raise
+		if transaction:
+			self.commit()
+		if self.stats is not None:
+			self._countPayment(augmentations, False, False)
+
+	def flowPayment(self, sender, receiver, amount):
+		"""
+		Route a payment as augmentPayment does, but decide first whether the
+		full amount can be paid, so that a failed payment writes nothing.
+
+		The first fewest-hop path is found as in augmentPayment, and paid if
+		it carries the whole amount. Otherwise one run of maxFlow, capped at
+		amount, decides: an infeasible payment fails with no write, and a
+		feasible one is paid by augmentPayment along the paths it would use
+		alone, so both methods leave the network the same. The flow is
+		compared with amount allowing for rounding, as in feasible.
+		"""
+		try:
+			path = self._fewestHops(receiver, sender)
+		except PathError:
+			self._unreachable()
+			if self.stats is not None:
+				self._countPayment(0, True, False)
+			raise CreditError()
+		if self.capacity(path) >= amount:
 			for src, dst in zip(path[1:], path):
-				self.makePayment(src, dst, min(capacity, remaining))
-			remaining = max(remaining - capacity, 0)
+				self.makePayment(src, dst, amount)
+			if self.stats is not None:
+				self.stats[("path_lengths", len(path) - 1)] += 1
+				self._countPayment(1, False, False)
+			return
+		if self.maxFlow(receiver, sender, amount) < amount * (1 - 1e-9):
+			if self.stats is not None:
+				self._countPayment(0, True, False)
+			raise CreditError()
+		self.augmentPayment(sender, receiver, amount)
+
+	def maxFlow(self, origin, destination, bound=float("inf")):
+		"""
+		The largest flow of credit from origin to destination, stopping once
+		it reaches bound, by Dinic's algorithm.
+
+		Paying along a path adds credit to its reverse edges, so the network
+		is its own residual graph, and this is the most that augmentPayment
+		could pay. Each phase levels the nodes by a BFS over edges with credit
+		left and pushes a blocking flow along edges that climb one level. The
+		network is not changed: residual maps (src, dst) to the credit left
+		on edges the flow has used, and added holds each node's reverse edges
+		that are not in the network.
+		"""
+		residual = {}
+		added = {}
+		flow = 0.
+		while flow < bound:
+			levels = self._flowLevels(origin, destination, residual, added)
+			if destination not in levels:
+				break
+			arcs = {}
+			while flow < bound:
+				path = self._blockingPath(origin, destination, levels, arcs, \
+						residual, added)
+				if path is None:
+					break
+				push = min([bound - flow] + [self._residual(src, dst, \
+						residual) for src, dst in zip(path, path[1:])])
+				for src, dst in zip(path, path[1:]):
+					residual[(src, dst)] = self._residual(src, dst, residual) \
+							- push
+					residual[(dst, src)] = self._residual(dst, src, residual) \
+							+ push
+					if not self.adjacent(dst, src):
+						added.setdefault(dst, set()).add(src)
+				flow += push
+		if self.stats is not None:
+			self.stats["max_flows"] += 1
+		return flow
+
+	def _residual(self, src, dst, residual):
+		"""Credit left on edge (src, dst) under residual (see maxFlow)."""
+		if (src, dst) in residual:
+			return residual[(src, dst)]
+		if self.adjacent(src, dst):
+			return self.edgeWeight(src, dst)
+		return 0.
+
+	def _flowLevels(self, origin, destination, residual, added):
+		"""Hop distances from origin over edges with credit left."""
+		levels = {origin:0}
+		frontier = [origin]
+		while frontier and destination not in levels:
+			if self.stats is not None:
+				self.stats["expansions"] += len(frontier)
+			nextFrontier = []
+			for node in frontier:
+				for neighbor in chain(self.neighbors(node), \
+						added.get(node, ())):
+					if neighbor not in levels and self._residual(node, \
+							neighbor, residual) > 0:
+						levels[neighbor] = levels[node] + 1
+						nextFrontier.append(neighbor)
+			frontier = nextFrontier
+		if self.stats is not None:
+			self.stats["searches"] += 1
+		return levels
+
+	def _blockingPath(self, origin, destination, levels, arcs, residual, \
+			added):
+		"""
+		A path from origin to destination that climbs one level per edge with
+		credit left on each, or None. arcs holds each visited node's untried
+		edges; edges found full or leading to a dead end are dropped from it.
+		"""
+		path = [origin]
+		while path:
+			node = path[-1]
+			if node == destination:
+				return path
+			if node not in arcs:
+				arcs[node] = [n for n in chain(self.neighbors(node), \
+						added.get(node, ())) if levels.get(n) == levels[node] \
+						+ 1]
+			candidates = arcs[node]
+			while candidates and self._residual(node, candidates[-1], \
+					residual) <= 0:
+				candidates.pop()
+			if candidates:
+				path.append(candidates[-1])
+			else:
+				path.pop()
+				if path:
+					arcs[path[-1]].pop()
+		return None
+
+	def _fewestHops(self, origin, destination):
+		"""
+		shortestPath, trying hubPath first if hubs are set, and before that
+		the path cache if it is set.
+		"""
+		if self.pathCache is not None:
+			return self._cachedPath(origin, destination)
+		path = self._hubPath(origin, destination)
+		if path is not None:
+			return path
+		return self.shortestPath(origin, destination)
+
+	def _hubPath(self, origin, destination):
+		if self.hubs is None:
+			return None
+		path = self.hubPath(origin, destination)
+		if path is not None and self.stats is not None:
+			self.stats["hub_paths"] += 1
+		return path
+
+	def _cachedPath(self, origin, destination):
+		"""
+		The path last found from origin to destination if bfsPath would still
+		find it, or a PathError if it would still find none; otherwise the
+		result of a new search, which is remembered.
+
+		An entry holds the path, of L hops, and the depths of the nodes that
+		the search found fewer than L hops from origin (any other node counts
+		as L deep). bfsPath still finds the path while every hop is present
+		and every edge out of a node in the entry (depth d) leads to a node at
+		most d+1 deep, and only to a node of the path at depth d+1 if no lower
+		than the path's node at depth d. Removing edges keeps this true and
+		the path's own nodes keep their depths, so only nodes that an edge
+		has since appeared out of need checking: those logged in self.touched
+		after the entry's position (found through self.lastTouched, each
+		node's latest position in the log, if the entry is further behind
+		than it has nodes). Edges run out only by being removed, so a present
+		hop has capacity.
+
+		If there was no path, the entry's path is None and its depths hold
+		every node the search reached; there is still none while no edge
+		leads out of them.
+
+		stats counts hits and misses and the time each took.
+		"""
+		start = time() if self.stats is not None else None
+		entry = self.pathCache.get((origin, destination))
+		if entry is not None and self._validPath(*entry):
+			entry[0] = len(self.touched)
+			path = entry[1]
+			if self.stats is not None:
+				self.stats["path_cache_hits"] += 1
+				self.stats["time_path_cache_hits"] += time() - start
+		else:
+			path = self._hubPath(origin, destination)
+			if path is None:
+				path, depths = self._searchDepths(origin, destination)
+			elif len(path) == 2:
+				depths = {origin:0}
+			else:
+				depths = dict([(n, 1) for n in self.neighbors(origin)])
+				depths[origin] = 0
+			self.pathCache[(origin, destination)] = [len(self.touched), path, \
+					depths]
+			if self.stats is not None:
+				self.stats["path_cache_misses"] += 1
+				self.stats["time_path_cache_misses"] += time() - start
+		if path is None:
+			raise PathError()
+		return path
+
+	def _validPath(self, position, path, depths):
+		"""Check a path cache entry (see _cachedPath)."""
+		if path is not None:
+			for src, dst in zip(path, path[1:]):
+				if not self.adjacent(src, dst):
+					return False
+			hops = len(path) - 1
+		if position == len(self.touched):
+			return True
+		if len(self.touched) - position <= len(depths):
+			touched = [n for n in set(self.touched[position:]) if n in depths]
+		else:
+			touched = [n for n in depths if self.lastTouched.get(n, -1) >= \
+					position]
+		for node in touched:
+			depth = depths[node]
+			for neighbor in self.neighbors(node):
+				if path is None:
+					if neighbor not in depths:
+						return False
+					continue
+				d = depths.get(neighbor, hops)
+				if d > depth + 1 or (d == depth + 1 and neighbor == path[d] \
+						and node < path[depth]):
+					return False
+		return True
+
+	def _searchDepths(self, origin, destination):
+		"""
+		bfsPath's path (None if there is none) and the depths of the nodes its
+		search found fewer hops from origin than destination.
+		"""
+		parents, levels = self.bfsTree(origin, destination)
+		if destination not in parents:
+			return None, dict.fromkeys(parents, 0)
+		return tracePath(parents, destination), dict([(node, depth) for \
+				depth, level in enumerate(levels) for node in level])
+
+	def _unreachable(self):
+		"""The receiver could not reach the sender; refresh the index."""
+		if self.reachability is not None:
+			self.reachability.miss()
+
+	def _countPayment(self, augmentations, failed, rolledBack):
+		self.stats["payments"] += 1
+		self.stats["augmentations"] += augmentations
+		self.stats[("augmentations_per_payment", augmentations)] += 1
+		self.stats["failed_payments"] += failed
+		self.stats["rolled_back_payments"] += rolledBack
+
+
+class ArrayCreditNetwork(CreditNetwork):
+	"""
+	CreditNetwork stored in NumPy arrays over integer node indices.
+
+	Every node pair that can carry credit has a slot in each direction, with
+	the capacity, a presence mask, the destination index and the slot of the
+	opposite edge (reverse). Node i's slots are the first lengths[i] of the
+	rooms[i] slots from starts[i]; self.slots maps i*n+j to the slot of
+	(i, j). Payments only create edges opposite existing ones, so slots are
+	rarely added; a new pair goes into the spare room of both rows, and a
+	full row moves to the end of the arrays with twice the room, so finding
+	a slot for an edge is amortized O(degree).
+
+	Networks of at most DENSE_NODES nodes are laid out densely instead, with
+	slot i*n+j for every pair, so a lookup is arithmetic and a row is a
+	contiguous mask.
+
+	bits[i] mirrors node i's present out-edges as a bitmask over node
+	indices (as in ReachabilityIndex), and degrees[i] counts them, so a
+	search can visit the few neighbors of a node without a scan of its row.
+	Updating a mask rebuilds a Python int of n bits, so an edge that appears
+	or disappears costs O(n/64) word operations, and removing a node
+	O(degree * n/64).
+
+	Forks share the layout, which is copied before one of them changes it.
+	Nodes are indexed in sorted order, and searches break ties as
+	Graph.bfsPath does, so routing matches CreditNetwork exactly.
+
+	Payments are still routed one at a time, so CreditNetwork remains the
+	better choice when searches reach few nodes each. This class is meant
+	for dense credit, and a saved network can be memory-mapped by many
+	processes (LoadCrednet).
+	"""
+	ARRAYS = ["starts", "lengths", "rooms", "indices", "reverse", \
+			"capacities", "present", "alive"]
+	DENSE_NODES = 1024
+	SCALAR_EDGES = 64
+
+	def __init__(self, nodes=[], weightedEdges=[], routing="augmentPayment", \
+			search="bfsPath", reachability=False, hubs=None, pathCache=False):
+		self.journal = None
+		self.marks = []
+		self.stats = None
+		self.hubs = None
+		self.pathCache = None
+		self.touched = []
+		self.lastTouched = {}
+		self.routing = routing
+		self.search = search
+		self.labels = sorted(nodes)
+		self.index = dict((node, i) for i, node in enumerate(self.labels))
+		self.nodes = set(self.labels)
+		self.alive = ones(len(self.labels), dtype=bool)
+		self.distanceCache = dict()
+		self._build(list(weightedEdges))
+		self.reachability = ReachabilityIndex(self) if reachability else None
+		self.setHubs(hubs)
+		self.setPathCache(pathCache)
+
+	def _build(self, weightedEdges):
+		"""Lay out the arrays for the given (src, dst, weight) edges."""
+		n = len(self.labels)
+		src = array([self.index[e[0]] for e in weightedEdges], dtype=int64)
+		dst = array([self.index[e[1]] for e in weightedEdges], dtype=int64)
+		self.dense = n <= self.DENSE_NODES
+		if self.dense:
+			self.starts = arange(n, dtype=int64) * n
+			self.lengths = full(n, n, dtype=int64)
+			self.indices = tile(arange(n, dtype=int64), n)
+			self.reverse = self.indices * n + arange(n * n) // max(n, 1)
+			self.slots = None
+			slots = src * n + dst
+		else:
+			keys = unique(concatenate([src * n + dst, dst * n + src]))
+			self.indices = keys % n
+			self.lengths = bincount(keys // n, minlength=n).astype(int64)
+			self.starts = cumsum(self.lengths) - self.lengths
+			self.reverse = keys.searchsorted(self.indices * n + keys // n)
+			self.slots = dict(zip(keys.tolist(), range(len(keys))))
+			slots = keys.searchsorted(src * n + dst)
+		self.rooms = array(self.lengths)
+		self.size = len(self.indices)
+		self.shared = False
+		self.capacities = zeros(self.size)
+		self.present = zeros(self.size, dtype=bool)
+		self.capacities[slots] = [e[2] for e in weightedEdges]
+		self.present[slots] = True
+		self._buildBits()
+
+	def _buildBits(self):
+		n = len(self.labels)
+		slots = flatnonzero(self.present)
+		src = self._source(slots)
+		self.degrees = bincount(src, minlength=n).tolist()
+		if self.dense:
+			self.bits = [self._toBits(row) for row in self.present.reshape(n, \
+					n)]
+			return
+		self.bits = [0] * n
+		for i, j in zip(src.tolist(), self.indices[slots].tolist()):
+			self.bits[i] |= 1 << j
+
+	def _toBits(self, mask):
+		"""The bitmask of the True positions of a boolean array."""
+		return int(packbits(mask[::-1]).tostring().encode("hex") or "0", \
+				16) >> -len(mask) % 8
+
+	def _layout(self):
+		"""Recover slots, size and bits from the arrays of a loaded network."""
+		n = len(self.labels)
+		self.size = int(concatenate([[0], self.starts + self.rooms]).max())
+		self.shared = True
+		self._buildBits()
+		if self.dense:
+			self.slots = None
+			return
+		rows = repeat(arange(n), self.lengths)
+		slots = self._rowSlots(arange(n))
+		self.slots = dict(zip((rows * n + self.indices[slots]).tolist(), \
+				slots.tolist()))
+
+	def _slot(self, i, j):
+		"""Slot of the pair of node indices (i, j), or -1 if there is none."""
+		if self.slots is None:
+			return i * len(self.labels) + j
+		return self.slots.get(i * len(self.labels) + j, -1)
+
+	def _row(self, i):
+		"""The slice of node index i's slots."""
+		lo = int(self.starts[i])
+		return slice(lo, lo + int(self.lengths[i]))
+
+	def _rowSlots(self, nodes):
+		"""The slots of the rows of an array of node indices, in order."""
+		counts = self.lengths[nodes]
+		offsets = repeat(self.starts[nodes] - cumsum(counts) + counts, counts)
+		return offsets + arange(counts.sum())
+
+	def _neighbors(self, i):
+		"""Indices of the out-neighbors of node index i."""
+		row = self._row(i)
+		if self.slots is None:
+			return flatnonzero(self.present[row]).tolist()
+		return self.indices[row][self.present[row]].tolist()
+
+	def _source(self, slot):
+		"""The index of the node whose row holds slot."""
+		return self.indices[self.reverse[slot]]
+
+	def _pay(self, slot, amount):
+		"""Debit credit edge <slot> by amount and credit the opposite edge."""
+		back = self.reverse[slot]
+		if self.journal is not None:
+			self._recordSlot(slot)
+			self._recordSlot(back)
+		if self.present[back]:
+			self.capacities[back] += amount
+		else:
+			src, dst = int(self.indices[slot]), int(self.indices[back])
+			if self.reachability is not None:
+				self.reachability.addEdge(self.labels[src], self.labels[dst])
+			self._touch(self.labels[src])
+			self.capacities[back] = amount
+			self.present[back] = True
+			self.bits[src] |= 1 << dst
+			self.degrees[src] += 1
+			self.distanceCache.clear()
+		self.capacities[slot] -= amount
+		if self.capacities[slot] == 0:
+			self.present[slot] = False
+			src, dst = int(self.indices[back]), int(self.indices[slot])
+			self.bits[src] &= ~(1 << dst)
+			self.degrees[src] -= 1
+			self.distanceCache.clear()
+
+	def _recordSlot(self, slot):
+		src = self.labels[self._source(slot)]
+		dst = self.labels[self.indices[slot]]
+		if self.present[slot]:
+			self.journal.append((src, dst, float(self.capacities[slot])))
+		else:
+			self.journal.append((src, dst, None))
+
+	def _insert(self, i, j):
+		"""Give the pair (i, j) a slot each way; return the slot of (i, j)."""
+		if self.shared:
+			for name in ["starts", "lengths", "rooms", "indices", "reverse"]:
+				setattr(self, name, array(getattr(self, name)))
+			self.slots = dict(self.slots)
+			self.shared = False
+		slot, back = self._append(i, j), self._append(j, i)
+		self.reverse[slot], self.reverse[back] = back, slot
+		return slot
+
+	def _append(self, i, j):
+		if self.lengths[i] == self.rooms[i]:
+			self._move(i, max(2 * int(self.rooms[i]), 4))
+		slot = int(self.starts[i] + self.lengths[i])
+		self.lengths[i] += 1
+		self.indices[slot] = j
+		self.slots[i * len(self.labels) + j] = slot
+		return slot
+
+	def _move(self, i, room):
+		"""Move node index i's row to the end of the arrays, with more room."""
+		if self.size + room > len(self.indices):
+			grow = max(self.size + room, 2 * len(self.indices)) - \
+					len(self.indices)
+			self.indices = concatenate([self.indices, full(grow, -1, \
+					dtype=int64)])
+			self.reverse = concatenate([self.reverse, full(grow, -1, \
+					dtype=int64)])
+			self.capacities = concatenate([self.capacities, zeros(grow)])
+			self.present = concatenate([self.present, zeros(grow, \
+					dtype=bool)])
+		old = arange(self.starts[i], self.starts[i] + self.lengths[i])
+		new = old - old[:1] + self.size if len(old) else old
+		for name in ["indices", "reverse", "capacities", "present"]:
+			getattr(self, name)[new] = getattr(self, name)[old]
+		self.reverse[self.reverse[new]] = new
+		self.present[old] = False
+		n = len(self.labels)
+		for slot, j in zip(new.tolist(), self.indices[new].tolist()):
+			self.slots[i * n + j] = slot
+		self.starts[i], self.rooms[i] = self.size, room
+		self.size += room
+
+	def addNode(self, node):
+		if self.readOnly:
+			raise ReadOnlyError()
+		assert node not in self.nodes, "node " +str(node)+ " already exists"
+		edges = self.allEdges()
+		self.labels = sorted(self.labels + [node])
+		self.index = dict((n, i) for i, n in enumerate(self.labels))
+		self.nodes.add(node)
+		self.alive = array([n in self.nodes for n in self.labels])
+		self._build(edges)
+		self.distanceCache.clear()
+		if self.reachability is not None:
+			self.reachability.invalidate()
+		self.setHubs(self.hubs)
+
+	def removeNode(self, node):
+		if self.readOnly:
+			raise ReadOnlyError()
+		assert self.journal is None, "node removal cannot be journaled"
+		i = self.index[node]
+		row = self._row(i)
+		for j in self.indices[row][self.present[self.reverse[row]]].tolist():
+			self.bits[j] &= ~(1 << i)
+			self.degrees[j] -= 1
+		self.bits[i] = 0
+		self.degrees[i] = 0
+		self.present[row] = False
+		self.present[self.reverse[row]] = False
+		self.alive[i] = False
+		self.nodes.remove(node)
+		self.distanceCache.clear()
+		self._dropHub(node)
+		self._clearPathCache()
+
+	def _copy(self):
+		"""
+		Only capacities, present and alive are copied, so a fork of a
+		read-only network can be changed; the layout is shared until _insert
+		changes it (even when it is read-only memory maps).
+		"""
+		copy = shallowCopy(self)
+		copy.marks = []
+		copy.nodes = set(self.nodes)
+		copy.capacities = array(self.capacities)
+		copy.present = array(self.present)
+		copy.alive = array(self.alive)
+		copy.bits = list(self.bits)
+		copy.readOnly = False
+		copy.degrees = list(self.degrees)
+		copy.distanceCache = dict()
+		copy.shared = self.shared = True
+		return copy
+
+	def save(self, directory):
+		"""
+		Write the arrays to directory as .npy files, which LoadCrednet can
+		memory-map so that processes share one copy.
+		"""
+		numpy.save(os.path.join(directory, "labels.npy"), array(self.labels, \
+				dtype=int64))
+		for name in self.ARRAYS:
+			numpy.save(os.path.join(directory, name + ".npy"), getattr(self, \
+					name))
+		self._saveSettings(directory)
+
+	def _settings(self):
+		settings = CreditNetwork._settings(self)
+		settings["dense"] = self.dense
+		return settings
+
+	def _setEdge(self, src, dst, weight):
+		if self.readOnly:
+			raise ReadOnlyError()
+		if self.reachability is not None:
+			self.reachability.addEdge(src, dst)
+		slot = self._slot(self.index[src], self.index[dst])
+		i, j = self.index[src], self.index[dst]
+		if slot < 0 or not self.present[slot]:
+			self._touch(src)
+			self.bits[i] |= 1 << j
+			self.degrees[i] += 1
+			self.distanceCache.clear()
+		if slot < 0:
+			slot = self._insert(i, j)
+		self.capacities[slot] = weight
+		self.present[slot] = True
+
+	def _clearEdge(self, src, dst):
+		if self.readOnly:
+			raise ReadOnlyError()
+		slot = self._slot(self.index[src], self.index[dst])
+		if slot < 0 or not self.present[slot]:
+			raise KeyError((src, dst))
+		self.present[slot] = False
+		self.bits[self.index[src]] &= ~(1 << self.index[dst])
+		self.degrees[self.index[src]] -= 1
+		self.distanceCache.clear()
+
+	def adjacent(self, n1, n2):
+		slot = self._slot(self.index[n1], self.index[n2])
+		return slot >= 0 and bool(self.present[slot])
+
+	def edgeWeight(self, src, dst):
+		slot = self._slot(self.index[src], self.index[dst])
+		if slot < 0 or not self.present[slot]:
+			raise KeyError((src, dst))
+		return float(self.capacities[slot])
+
+	def neighbors(self, node):
+		return [self.labels[i] for i in self._neighbors(self.index[node])]
+
+	def predecessors(self, node):
+		row = self._row(self.index[node])
+		return [self.labels[j] for j in self.indices[row][self.present[ \
+				self.reverse[row]]].tolist()]
+
+	def degree(self, node):
+		return self.degrees[self.index[node]]
+
+	def allEdges(self):
+		slots = flatnonzero(self.present)
+		src, dst = self._source(slots), self.indices[slots]
+		order = (src * len(self.labels) + dst).argsort()
+		return [(self.labels[s], self.labels[d], float(w)) for s, d, w in \
+				zip(src[order].tolist(), dst[order].tolist(), \
+				self.capacities[slots[order]])]
+
+	def iterEdges(self):
+		for src, dst, weight in self.allEdges():
+			yield (src, dst)
+
+	def numEdges(self):
+		return int(self.present.sum())
+
+	def adjacencyMatrix(self):
+		"""
+		Edge weights (0 where there is no edge), with a row and a column for
+		each node in sorted order, so nodes 0..n-1 index it directly.
+		"""
+		rows = flatnonzero(self.alive)
+		slots = flatnonzero(self.present)
+		positions = cumsum(self.alive) - 1
+		adj = zeros((len(rows), len(rows)))
+		adj[positions[self._source(slots)], positions[self.indices[slots]]] = \
+				self.capacities[slots]
+		return adj.tolist()
+
+	def distanceMatrix(self, cutoff=None):
+		"""As Graph.distanceMatrix, expanding each level through bits."""
+		if cutoff not in self.distanceCache:
+			n = len(self.nodes)
+			bound = n if cutoff is None else min(cutoff, n)
+			rows = []
+			for source in range(n):
+				row = [-1]*n
+				row[source] = 0
+				start = self.index[source]
+				reached = 1 << start
+				frontier = [start]
+				depth = 0
+				while frontier and depth < bound:
+					depth += 1
+					new = 0
+					for node in frontier:
+						new |= self.bits[node]
+					new &= ~reached
+					reached |= new
+					frontier = []
+					while new:
+						low = new & -new
+						node = low.bit_length() - 1
+						row[self.labels[node]] = depth
+						frontier.append(node)
+						new ^= low
+				rows.append(row)
+			self.distanceCache[cutoff] = array(rows, dtype=min_scalar_type( \
+					-max(bound, 1))).reshape(n, n)
+		return self.distanceCache[cutoff]
+
+	def capacity(self, path):
+		minCapacity = float("inf")
+		for src, dst in zip(path, path[1:]):
+			minCapacity = min(minCapacity, self.edgeWeight(src, dst))
+		return minCapacity
+
+	def flowBound(self, origin, destination):
+		row = self._row(self.index[origin])
+		out = self.capacities[row][self.present[row]].sum()
+		back = self.reverse[self._row(self.index[destination])]
+		return min(out, self.capacities[back][self.present[back]].sum())
+
+	def makePayment(self, sender, receiver, amount):
+		if self.readOnly:
+			raise ReadOnlyError()
+		assert amount > 0
+		slot = self._slot(self.index[receiver], self.index[sender])
+		if slot < 0 or not self.present[slot] or \
+				self.capacities[slot] < amount:
+			raise CreditError()
+		self._pay(slot, amount)
+
+	def bfsPath(self, origin, destination):
+		"""
+		Find a path with the fewest hops by BFS over node indices.
+
+		Each node is reached from the first node of the previous level (in
+		node order) with an edge to it, so ties are broken exactly as in
+		Graph.bfsPath.
+		"""
+		parents = self.bfsTree(origin, destination)[0]
+		if self.index[destination] not in parents:
+			raise PathError()
+		return [self.labels[node] for node in tracePath(parents, \
+				self.index[destination])]
+
+	def bfsTree(self, origin, destination):
+		"""
+		As Graph.bfsTree, but the parents are of node indices. A level with
+		up to SCALAR_EDGES edges out of it is expanded through the bits of
+		its nodes; a larger one with array operations, taking each new node's
+		parent to be the first node of the level with an edge to it.
+		"""
+		start, goal = self.index[origin], self.index[destination]
+		parents = {start:None}
+		reached = 1 << start
+		mask = None
+		frontier = [start]
+		levels = []
+		while frontier and goal not in parents:
+			levels.append(frontier)
+			if self.stats is not None:
+				self.stats["expansions"] += len(frontier)
+			if len(frontier) <= self.SCALAR_EDGES and sum([self.degrees[node] \
+					for node in frontier]) <= self.SCALAR_EDGES:
+				nextFrontier = []
+				for node in frontier:
+					new = self.bits[node] & ~reached
+					reached |= new
+					while new:
+						low = new & -new
+						neighbor = low.bit_length() - 1
+						parents[neighbor] = node
+						nextFrontier.append(neighbor)
+						new ^= low
+				frontier = sorted(nextFrontier)
+				mask = None
+				continue
+			if mask is None:
+				mask = zeros(len(self.labels), dtype=bool)
+				mask[parents.keys()] = True
+			nodes = array(frontier)
+			if self.slots is None:
+				n = len(self.labels)
+				rows = self.present.reshape(n, n)[nodes]
+				rows &= ~mask
+				new = rows.any(0).nonzero()[0]
+				sources = nodes[rows[:, new].argmax(0)]
+			else:
+				slots = self._rowSlots(nodes)
+				slots = slots[self.present[slots]]
+				slots = slots[~mask[self.indices[slots]]]
+				new, first = unique(self.indices[slots], return_index=True)
+				sources = self._source(slots[first])
+			mask[new] = True
+			reached = self._toBits(mask)
+			frontier = new.tolist()
+			parents.update(zip(frontier, sources.tolist()))
+		if self.stats is not None:
+			self.stats["searches"] += 1
+		return parents, levels
+
+	def _searchDepths(self, origin, destination):
+		parents, levels = self.bfsTree(origin, destination)
+		if self.index[destination] not in parents:
+			return None, dict.fromkeys([self.labels[node] for node in \
+					parents], 0)
+		return [self.labels[node] for node in tracePath(parents, \
+				self.index[destination])], dict([(self.labels[node], depth) \
+				for depth, level in enumerate(levels) for node in level])
+
+
+class BatchCreditNetwork:
+	"""
+	Independent credit networks over the same nodes, stepped in lockstep.
 
+	Replica r's credit from node i to node j is capacities[r, i, j], where
+	present[r, i, j] says whether the edge exists, and alive[r, i] whether
+	node i is still in the network; nodes are indexed in sorted order. The
+	dense layout makes one step of every replica a handful of array
+	operations, so this is meant for small networks (up to a few hundred
+	nodes).
 
-def SimulateCreditNetwork(CN, params, DP, TR, BV, SC):
+	routePayments settles one payment in every replica at once. Direct and
+	two-hop paths are read off the arrays; only replicas that need a longer
+	path search, all together. Paths and arithmetic are those of
+	augmentPayment, so each replica ends exactly as its network would alone.
+	"""
+	def __init__(self, networks, nodes):
+		self.labels = array(sorted(nodes), dtype=int64)
+		shape = (len(networks), len(self.labels), len(self.labels))
+		self.capacities = zeros(shape)
+		self.present = zeros(shape, dtype=bool)
+		self.alive = zeros(shape[:2], dtype=bool)
+		for r, N in enumerate(networks):
+			self.alive[r, self.positions(list(N.nodes))] = True
+			edges = N.allEdges()
+			if not edges:
+				continue
+			src, dst, weights = zip(*edges)
+			src, dst = self.positions(src), self.positions(dst)
+			self.capacities[r, src, dst] = weights
+			self.present[r, src, dst] = True
+
+	def positions(self, nodes):
+		"""Indices of the given nodes."""
+		return self.labels.searchsorted(nodes)
+
+	def routePayments(self, senders, receivers, amounts):
+		"""
+		Route a payment from senders[r] to receivers[r] in each replica r, as
+		routePayment would, returning a mask of the replicas that paid.
+		Payments involving a removed node fail.
+
+		Each round pays one shortest path in every replica whose payment is
+		incomplete. A failed payment is rolled back from a journal of the
+		edges the rounds wrote.
+		"""
+		return self._routePayments(self.positions(senders), \
+				self.positions(receivers), amounts)
+
+	def _routePayments(self, sender, receiver, amounts):
+		"""routePayments on node indices."""
+		rows = arange(len(self.alive))
+		pending = self.alive[rows, sender] & self.alive[rows, receiver]
+		paid = pending.copy()
+		remaining = array(amounts, dtype=float)
+		journal = []
+		while pending.any():
+			r = flatnonzero(pending)
+			paths = self._paths(r, receiver[r], sender[r])
+			hops = paths[:, 1:] >= 0
+			capacity = where(hops, self.capacities[r[:, None], paths[:, :-1], \
+					paths[:, 1:]], float("inf")).min(1)
+			# a zero-capacity edge fails makePayment's assertion
+			failed = ~hops[:, 0] | (capacity == 0)
+			paid[r[failed]] = False
+			payment = minimum(capacity, remaining[r])
+			remaining[r] = maximum(remaining[r] - capacity, 0)
+			pending[r] = ~failed & (remaining[r] > 0)
+			# only payments that go on to another round can still fail
+			pay = ~failed[:, None] & hops
+			replica = r[:, None].repeat(hops.shape[1], 1)[pay]
+			self._pay(replica, paths[:, :-1][pay], paths[:, 1:][pay], \
+					payment[:, None].repeat(hops.shape[1], 1)[pay], journal \
+					if pending.any() else None, pending[replica])
+		undo = ~paid
+		for rows, src, dst, capacities, present in reversed(journal):
+			restore = undo[rows]
+			self.capacities[rows[restore], src[restore], dst[restore]] = \
+					capacities[restore]
+			self.present[rows[restore], src[restore], dst[restore]] = \
+					present[restore]
+		return paid
+
+	def _paths(self, rows, start, goal):
+		"""
+		The nodes along a shortest path from start to goal in each of the
+		given replicas, padded with -1; all -1 after start if there is none.
+		Ties are broken as in bfsPath: a two-hop path goes through the
+		lowest-indexed node that completes one. Paths longer than two hops
+		are found by _search.
+		"""
+		each = arange(len(rows))
+		twoHops = self.present[rows, start] & self.present[rows, :, goal]
+		middle = twoHops.argmax(1)
+		direct = self.present[rows, start, goal]
+		twoHop = ~direct & twoHops[each, middle]
+		paths = full((len(rows), 3), -1, dtype=int64)
+		paths[:, 0] = start
+		paths[direct, 1] = goal[direct]
+		paths[twoHop, 1] = middle[twoHop]
+		paths[twoHop, 2] = goal[twoHop]
+		# a node with no credit out, or none in, cannot be on any path
+		longer = flatnonzero(~direct & ~twoHop & self.present[rows, \
+				start].any(1) & self.present[rows, :, goal].any(1))
+		if not len(longer):
+			return paths
+		found = self._search(rows[longer], start[longer], goal[longer])
+		if found.shape[1] > 3:
+			paths = concatenate([paths, full((len(rows), found.shape[1] - 3), \
+					-1, dtype=int64)], 1)
+		paths[longer, :found.shape[1]] = found
+		return paths
+
+	def _search(self, rows, start, goal):
+		"""
+		bfsPath in each of the given replicas at once, returning paths as
+		_paths does. The frontiers are expanded level by level, then the path
+		is traced back from the goal: a node's parent is the lowest-indexed
+		node of the previous frontier that reaches it, as in bfsPath's sorted
+		frontiers.
+		"""
+		n, each = len(self.labels), arange(len(rows))
+		reached = zeros((len(rows), n), dtype=bool)
+		reached[each, start] = True
+		levels = [reached.copy()]
+		depth = zeros(len(rows), dtype=int64)
+		while (levels[-1].any(1) & ~reached[each, goal]).any():
+			# OR together the out-edges of each replica's frontier nodes
+			replica, node = divmod(flatnonzero(levels[-1]), n)
+			expanding, first = unique(replica, return_index=True)
+			frontier = zeros((len(rows), n), dtype=bool)
+			frontier[expanding] = logical_or.reduceat(self.present[ \
+					rows[replica], node], first) & ~reached[expanding]
+			reached |= frontier
+			depth[frontier[each, goal]] = len(levels)
+			levels.append(frontier)
+		found = reached[each, goal]
+		paths = full((len(rows), max(depth.max(), 1) + 1), -1, dtype=int64)
+		paths[:, 0] = start
+		node = goal.copy()
+		for level in range(depth.max(), 0, -1):
+			walking = found & (depth >= level)
+			paths[walking, level] = node[walking]
+			parent = (levels[level-1] & self.present[rows, :, node]).argmax(1)
+			node = where(walking, parent, node)
+		return paths
+
+	def _pay(self, rows, src, dst, amounts, journal, journaled):
+		"""
+		ArrayCreditNetwork._pay on each replica's edge (src, dst), journaling
+		the old values of the replicas in the journaled mask.
+		"""
+		if journal is not None:
+			for i, j in [(src, dst), (dst, src)]:
+				journal.append((rows[journaled], i[journaled], j[journaled], \
+						self.capacities[rows, i, j][journaled], \
+						self.present[rows, i, j][journaled]))
+		self.capacities[rows, dst, src] = where(self.present[rows, dst, src], \
+				self.capacities[rows, dst, src] + amounts, amounts)
+		self.present[rows, dst, src] = True
+		self.capacities[rows, src, dst] -= amounts
+		self.present[rows, src, dst] = self.capacities[rows, src, dst] != 0
+
+
+def LoadCrednet(directory, mmap_mode=None):
+	"""
+	Read a network written by save(). With mmap_mode="r", the arrays of an
+	ArrayCreditNetwork are read-only memory maps, so the network is marked
+	readOnly: any change to it raises ReadOnlyError, and a fork() is the
+	network to change.
+	"""
+	with open(os.path.join(directory, "network.json")) as f:
+		settings = json.load(f)
+	cls = getattr(modules[__name__], settings["class"])
+	load = lambda name: numpy.load(os.path.join(directory, name + ".npy"), \
+			mmap_mode=mmap_mode)
+	if cls is CreditNetwork:
+		edges = load("edges").tolist()
+		weights = load("weights").tolist()
+		return CreditNetwork(load("nodes").tolist(), [(s, d, w) for (s, d), w \
+				in zip(edges, weights)], settings["routing"], \
+				settings["search"], settings["reachability"], \
+				settings.get("hubs"), settings.get("pathCache", False))
+	CN = cls([], [], settings["routing"], settings["search"])
+	CN.labels = load("labels").tolist()
+	CN.index = dict((node, i) for i, node in enumerate(CN.labels))
+	for name in cls.ARRAYS:
+		setattr(CN, name, load(name))
+	CN.dense = settings["dense"]
+	CN._layout()
+	CN.nodes = set(array(CN.labels)[CN.alive].tolist())
+	CN.readOnly = mmap_mode == "r"
+	CN.reachability = ReachabilityIndex(CN) if settings["reachability"] \
+			else None
+	CN.hubs = settings.get("hubs")
+	CN.setPathCache(settings.get("pathCache", False))
+	return CN
+
+
+class Checkpoint:
+	"""
+	A credit network frozen at one point of a simulation, such as just after
+	construction or just after defaults, with the payoffs so far and the
+	states of numpy.random and random.
+
+	Each fork() returns a fresh copy of the network and payoffs and restores
+	the random states, so any number of variant runs can continue from the
+	checkpoint without rebuilding the network or redrawing the matrices.
+	"""
+	def __init__(self, CN, payoffs=None):
+		self.network = CN.fork()
+		self.payoffs = None if payoffs is None else dict(payoffs)
+		self.numpyState = R.get_state()
+		self.randomState = random.getstate()
+
+	def fork(self):
+		"""Return (network, payoffs) and rewind the random states."""
+		R.set_state(self.numpyState)
+		random.setstate(self.randomState)
+		payoffs = None if self.payoffs is None else dict(self.payoffs)
+		return self.network.fork(), payoffs
+
+	def save(self, directory):
+		"""Write the checkpoint to a new directory, atomically."""
+		temp = directory.rstrip("/") + "." + str(os.getpid()) + ".tmp"
+		os.makedirs(temp)
+		self.network.save(temp)
+		numpy.save(os.path.join(temp, "numpy_state.npy"), self.numpyState[1])
+		with open(os.path.join(temp, "checkpoint.json"), "w") as f:
+			json.dump({"numpy_state":[self.numpyState[0]] + \
+					list(self.numpyState[2:]), "random_state": \
+					self.randomState, "payoffs":None if self.payoffs is None \
+					else self.payoffs.items()}, f)
+		os.rename(temp, directory)
+
+
+def LoadCheckpoint(directory, mmap_mode="r"):
+	"""Read a Checkpoint written by Checkpoint.save."""
+	with open(os.path.join(directory, "checkpoint.json")) as f:
+		saved = json.load(f)
+	checkpoint = Checkpoint(LoadCrednet(directory, mmap_mode))
+	state = saved["numpy_state"]
+	checkpoint.numpyState = (str(state[0]), numpy.load(os.path.join( \
+			directory, "numpy_state.npy"))) + tuple(state[1:])
+	version, internal, gauss = saved["random_state"]
+	checkpoint.randomState = (version, tuple(internal), gauss)
+	checkpoint.payoffs = None if saved["payoffs"] is None else dict( \
+			saved["payoffs"])
+	return checkpoint
+
+
+def ReplaceStrategyEdges(CN, agent, edges):
+	"""
+	Replace the credit <agent> extends to other agents by the given edges,
+	as if it had played another strategy when CN was built. Credit it
+	extends to banks (negative nodes) comes from the bank policy and is kept.
+
+	CN should be fresh from construction (a fork of a Checkpoint taken
+	then): before any default or payment, the edges out of an agent are
+	exactly those its strategy and the bank policy issued.
+	"""
+	for other in list(CN.neighbors(agent)):
+		if other >= 0:
+			CN.removeEdge(agent, other)
+	for edge in edges:
+		CN.addEdge(*edge)
+
+
+def SimulateCreditNetwork(CN, params, DP, TR, BV, SC, defaulters=None):
 	"""
 	CN - credit network
 	DP - default probability array
 	TR - transaction rate matrix
 	BV - buy value matrix
 	SC - sell cost matrix
+	defaulters - initial default draw (from InitWorld), or None to draw one
 	price - function to determine a price from value and cost
 	events - number of transactions to simulate
+
+	If CN.stats is a Counter, the time spent on defaults and transactions is
+	added to it, along with the routing counters of CN.
 	"""
-	price = params["price"]
-	events = params["events"]
-	strategies = params["strategies"]
-	prevent_zeros = params["prevent_zeros"]
+	for snapshot in StreamCreditNetwork(CN, params, DP, TR, BV, SC, \
+			defaulters, max(params["events"], 1)):
+		pass
+	return snapshot["payoffs"]
+
+
+def StreamCreditNetwork(CN, params, DP, TR, BV, SC, defaulters=None, \
+		every=1000):
+	"""
+	Generator form of SimulateCreditNetwork (which see for the arguments).
+
+	After defaults, a snapshot is yielded every <every> transactions and
+	after the last one. Each is a dict of:
+	events.....transactions simulated so far
+	succeeded..how many of them were paid
+	payoffs....a copy of the running payoffs
+	stats......a copy of CN.stats, or None
 
+	The final snapshot's payoffs are exactly what SimulateCreditNetwork
+	returns. Closing the generator early (see SteadyState) truncates the
+	simulation; the time spent so far is still added to CN.stats.
+	"""
 	payoffs = dict([(n,0.) for n in CN.nodes])
-	defaulters = filter(lambda n: R.binomial(1, DP[n]), CN.nodes)
+	start = time()
+	defaulters = DrawDefaulters(CN, params, DP, defaulters)
+	RemoveDefaulters(CN, payoffs, defaulters)
+	resumed = time()
+	if CN.stats is not None:
+		CN.stats["time_defaults"] += resumed - start
+	try:
+		for done, succeeded in TransactionSteps(CN, params, payoffs, TR, BV, \
+				SC, every):
+			if CN.stats is not None:
+				CN.stats["time_transactions"] += time() - resumed
+			yield {"events":done, "succeeded":succeeded, "payoffs": \
+					dict(payoffs), "stats":None if CN.stats is None else \
+					Counter(CN.stats)}
+			resumed = time()
+	except GeneratorExit:
+		if CN.stats is not None:
+			CN.stats["time_transactions"] += time() - resumed
+		raise
+
+
+def SteadyState(snapshots, tolerance, patience=3):
+	"""
+	Pass snapshots from StreamCreditNetwork through until per-agent payoff
+	rates have settled.
+
+	An agent's rate is its payoff gain per transaction since the first
+	snapshot. Once, for <patience> snapshots in a row, no agent's rate has
+	moved by more than tolerance since the snapshot before, the simulation
+	is stopped.
+	"""
+	first = None
+	rates = None
+	settled = 0
+	for snapshot in snapshots:
+		yield snapshot
+		if first is None:
+			first = snapshot
+		elif snapshot["events"] > first["events"]:
+			elapsed = snapshot["events"] - first["events"]
+			new_rates = dict([(n, (snapshot["payoffs"][n] - \
+					first["payoffs"][n]) / elapsed) for n in first["payoffs"]])
+			if rates is not None and max([abs(new_rates[n] - rates[n]) for \
+					n in rates] + [0]) <= tolerance:
+				settled += 1
+			else:
+				settled = 0
+			rates = new_rates
+		if settled >= patience:
+			snapshots.close()
+			return
+
+
+def DrawDefaulters(CN, params, DP, defaulters=None):
+	"""
+	Choose the nodes of CN that default, each with probability DP.
+
+	If defaulters is given, it is used as the first draw. With prevent_zeros,
+	no strategy may have all of its agents default. Agents of different
+	strategies default independently, so conditioning on this factors into
+	one condition per strategy, and params["prevent_zeros_method"] picks how
+	it is met:
+	conditional..only the offending strategies' agents are redrawn, each
+	             group straight from its conditional distribution (bounded
+	             time whatever DP is)
+	redraw.......every node is redrawn until the condition holds (expected
+	             time grows with the chance of a strategy defaulting entirely)
+	Any other method raises ValueError.
+	"""
+	if params["prevent_zeros_method"] not in ["conditional", "redraw"]:
+		raise ValueError("unknown prevent_zeros_method " + \
+				repr(params["prevent_zeros_method"]))
+	nodes = array(sorted(CN.nodes))
+	if defaulters is None:
+		defaulters = DrawDefaults(nodes, DP)
+	if not params["prevent_zeros"]:
+		return defaulters
 
 	# If all agents with the same strategy default, we'll get bad payoff data
-	while prevent_zeros:
-		prevent_zeros = False
-		for strat in set(strategies):
-			agents = filter(lambda a: strategies[a]==strat, CN.nodes)
-			if all([a in defaulters for a in agents]):
-				prevent_zeros = True
-				defaulters = filter(lambda n: R.binomial(1, DP[n]), CN.nodes)
-				break
+	groups = StrategyGroups(CN, params["strategies"])
+	defaulted = set(defaulters)
+	wiped = [g for g in groups if defaulted.issuperset(g)]
+	if params["prevent_zeros_method"] == "redraw":
+		while wiped:
+			defaulters = DrawDefaults(nodes, DP)
+			defaulted = set(defaulters)
+			wiped = [g for g in groups if defaulted.issuperset(g)]
+		return defaulters
+	for group in wiped:
+		defaulted.difference_update(group)
+		defaulted.update(ConditionalDefaults(group, DP))
+	return [n for n in nodes.tolist() if n in defaulted]
+
+
+def DrawDefaults(nodes, DP):
+	"""Nodes (an array) that default, each independently with probability DP."""
+	return nodes[R.random_sample(len(nodes)) < DP[nodes]].tolist()
 
+
+def StrategyGroups(CN, strategies):
+	"""The agents of CN grouped by strategy, each group in increasing order."""
+	groups = {}
+	for agent in sorted(CN.nodes):
+		if agent >= 0:
+			groups.setdefault(strategies[agent], []).append(agent)
+	return [groups[strat] for strat in sorted(groups)]
+
+
+def ConditionalDefaults(group, DP):
+	"""
+	Which agents of group default, given that at least one of them does not.
+
+	The first agent not to default is drawn from its exact conditional
+	distribution; the agents before it default and the rest are drawn as
+	usual. If every agent defaults with certainty, they all do.
+	"""
+	p = DP[array(group)]
+	first = concatenate([[1.], p[:-1].cumprod()]) * (1 - p)
+	cdf = cumsum(first)
+	if cdf[-1] <= 0:
+		return list(group)
+	k = min(cdf.searchsorted(R.random_sample() * cdf[-1], side="right"), \
+			len(group) - 1)
+	later = flatnonzero(R.random_sample(len(group) - k - 1) < p[k+1:])
+	return group[:k] + [group[k + 1 + i] for i in later]
+
+
+def RemoveDefaulters(CN, payoffs, defaulters):
+	"""
+	Remove defaulters from CN and payoffs.
+
+	Each remaining node loses the credit it had extended to the defaulters.
+	"""
 	for d in defaulters:
-		for n in CN.nodes:
-			if CN.adjacent(n, d):
-				payoffs[n] -= CN.weights[(n, d)]
+		for n in CN.predecessors(d):
+			payoffs[n] -= CN.edgeWeight(n, d)
 		CN.removeNode(d)
 		del payoffs[d]
 
-	m = R.multinomial(events, array(TR.flat))
-	l = TR.shape[0]
-	transactors = sum([[(i/l,i%l)]*m[i] for i in range(l**2)], [])
-	R.shuffle(transactors)
-	for b,s in transactors:
+
+def SimulateTransactions(CN, params, payoffs, TR, BV, SC):
+	"""
+	Route <events> payments drawn from TR, adding their surplus to payoffs.
+
+	Each transaction that succeeds earns the buyer BV and costs the seller SC.
+	"""
+	for step in TransactionSteps(CN, params, payoffs, TR, BV, SC, \
+			max(params["events"], 1)):
+		pass
+
+
+def TransactionSteps(CN, params, payoffs, TR, BV, SC, every):
+	"""
+	Route transactions as SimulateTransactions does, yielding (transactions
+	so far, how many succeeded) every <every> transactions and at the end.
+	"""
+	price = params["price"]
+	done = succeeded = 0
+	for b,s in Transactions(TR, params["events"]):
+		done += 1
 		try:
 			assert b in CN.nodes and s in CN.nodes
 			CN.routePayment(b, s, price(BV[b,s], SC[b,s]))
 		except (AssertionError, CreditError):
-			continue
-		payoffs[b] += BV[b,s]
-		payoffs[s] -= SC[b,s]
-	return payoffs
+			pass
+		else:
+			payoffs[b] += BV[b,s]
+			payoffs[s] -= SC[b,s]
+			succeeded += 1
+		if done % every == 0:
+			yield done, succeeded
+	if done == 0 or done % every:
+		yield done, succeeded
+
+
+def SimulateBatch(CNs, params, matrices, defaulters, states):
+	"""
+	Run SimulateCreditNetwork on each of CNs in lockstep (see
+	BatchCreditNetwork), returning the list of their payoffs.
+
+	params, matrices and defaulters hold each network's arguments to
+	SimulateCreditNetwork; all params must agree on events and price.
+	states holds the numpy.random state each simulation would start from.
+	Each network draws its defaults and transactions from its own state, so
+	its payoffs are exactly those of a SimulateCreditNetwork run from it.
+	The networks are not changed.
+	"""
+	networks = []
+	payoffs = []
+	schedules = []
+	for N, p, m, d, state in zip(CNs, params, matrices, defaulters, states):
+		R.set_state(state)
+		networks.append(N.fork())
+		payoffs.append(dict([(n,0.) for n in N.nodes]))
+		RemoveDefaulters(networks[-1], payoffs[-1], DrawDefaulters( \
+				networks[-1], p, m["DP"], d))
+		rng = R.RandomState()
+		rng.set_state(R.get_state())
+		schedules.append(TransactionChunks(m["TR"], p["events"], rng=rng))
+	batch = BatchCreditNetwork(networks, CNs[0].nodes)
+	rows = arange(len(CNs))
+	values = array([m["BV"] for m in matrices])
+	costs = array([m["SC"] for m in matrices])
+	totals = zeros(batch.alive.shape)
+	for r, p in enumerate(payoffs):
+		totals[r, batch.positions(p.keys())] = p.values()
+	for chunks in zip(*schedules):
+		buyers = array([chunk[0] for chunk in chunks])
+		sellers = array([chunk[1] for chunk in chunks])
+		BV = values[rows[:, None], buyers, sellers]
+		SC = costs[rows[:, None], buyers, sellers]
+		amounts = params[0]["price"](BV, SC)
+		gainers, losers = batch.positions(buyers), batch.positions(sellers)
+		for k in range(buyers.shape[1]):
+			paid = batch._routePayments(gainers[:, k], losers[:, k], \
+					amounts[:, k])
+			totals[rows[paid], gainers[paid, k]] += BV[paid, k]
+			totals[rows[paid], losers[paid, k]] -= SC[paid, k]
+	return [dict([(n, float(totals[r, i])) for n, i in zip(p.keys(), \
+			batch.positions(p.keys()))]) for r, p in enumerate(payoffs)]
+
+
+def Transactions(TR, events, chunk_size=10000, rng=R):
+	"""
+	Yield <events> (buyer, seller) pairs, each drawn independently from TR.
+
+	This is the distribution of a shuffled multinomial draw over TR.flat, but
+	pairs are drawn in chunks by inverse-CDF search, so memory is bounded by
+	chunk_size rather than by events.
+	"""
+	for buyers, sellers in TransactionChunks(TR, events, chunk_size, rng):
+		for pair in zip(buyers.tolist(), sellers.tolist()):
+			yield pair
+
+
+def TransactionChunks(TR, events, chunk_size=10000, rng=R):
+	"""
+	The transactions of Transactions, as (buyers, sellers) arrays of up to
+	chunk_size, drawn with rng (a RandomState, or numpy.random itself).
+	"""
+	l = TR.shape[0]
+	cdf = TR.cumsum()
+	cdf /= cdf[-1]
+	while events > 0:
+		size = min(chunk_size, events)
+		pairs = cdf.searchsorted(rng.random_sample(size), side="right")
+		yield divmod(pairs, l)
+		events -= size
 
 
 def InitMatrices(params):
@@ -147,24 +1850,83 @@ def InitMatrices(params):
 	return matrices
 
 
-def InitCrednet(matrices, params):
+def InitWorld(params):
+	"""
+	Draw everything about a simulation that does not depend on strategies.
+
+	Returns the InitMatrices matrices plus the social network and the list
+	of nodes that default (before any prevent_zeros redraws). Only the number
+	of strategies is used, so profiles of the same size can share worlds.
+	"""
+	world = InitMatrices(params)
+	world["social_network"] = InitSocialNetwork(params)
+	nodes = array(range(-params["num_banks"], len(params["strategies"])))
+	world["defaulters"] = DrawDefaults(nodes, world["DP"])
+	return world
+
+
+def InitCrednet(matrices, params, social_network=None):
 	"""
 	The following parameters are required:
 	strategies......list of strategies by which agents issue credit
 	social_network..1-argument function to create a social network
+	social_graph....Graph class to build it as (UndirectedGraph or
+					CompactGraph)
+	credit_network..CreditNetwork class to build (CreditNetwork or
+					ArrayCreditNetwork)
+	routing.........CreditNetwork method that routes payments (augmentPayment
+					or flowPayment)
+	search..........Graph method that finds fewest-hop paths (bfsPath or
+					bidirectionalPath)
+	reachability_index..whether to keep a ReachabilityIndex that rejects
+					infeasible payments without searching
+	hubs............nodes to route through before searching (see
+					CreditNetwork.setHubs): none, banks or detect
+	path_cache......whether to reuse each pair's last path while it is still
+					the one bfsPath would find (bfsPath search only)
 	num_banks.......number of banks to simulate (usually 0 or 1)
 	bank_policy.....the policy used to create credit edges involving banks
 
 	plus required parameters of AgentStrategies and BankPolicies
+
+	A social network is drawn unless one is given.
 	"""
-	n = len(params["strategies"])
-	social_network = getattr(GG, params["social_network"])(n)
-	AS = AgentStrategies(matrices, social_network, params)
+	if social_network is None:
+		social_network = InitSocialNetwork(params)
+	edges = InitEdges(matrices, social_network, params)
+	return BuildCrednet(edges, params)
+
+
+def InitSocialNetwork(params):
+	"""
+	Draw the social network, built as params["social_graph"]: UndirectedGraph,
+	or CompactGraph for large networks.
+	"""
+	return getattr(GG, params["social_network"])(len(params["strategies"]), \
+			graph=getattr(G, params["social_graph"]))
+
+
+def InitEdges(matrices, social_network, params, AS=None):
+	"""
+	Credit edges issued by every agent's strategy and the bank policy.
+
+	An AgentStrategies can be given to reuse its cached criterion matrices.
+	"""
+	if AS is None:
+		AS = AgentStrategies(matrices, social_network, params)
 	BP = BankPolicies(matrices, social_network, params)
-	nodes = range(-params["num_banks"], n)
-	edges = sum([AS.get_strategy(s)(agent) for agent,s in enumerate( \
-			params["strategies"])] + [BP.get_policy(params["bank_policy"])( \
-			bank) for bank in range(-params["num_banks"],0)], [])
-	return CreditNetwork(nodes, edges)
+	return list(chain.from_iterable([AS.get_strategy(s)(agent) for agent,s \
+			in enumerate(params["strategies"])] + [BP.get_policy( \
+			params["bank_policy"])(bank) for bank in \
+			range(-params["num_banks"],0)]))
+
+
+def BuildCrednet(edges, params):
+	nodes = range(-params["num_banks"], len(params["strategies"]))
+	hubs = {"none":None, "banks":range(-params["num_banks"], 0), \
+			"detect":"detect"}[params["hubs"]]
+	return getattr(modules[__name__], params["credit_network"])(nodes, edges, \
+			params["routing"], params["search"], params["reachability_index"], \
+			hubs, params["path_cache"])
 
 
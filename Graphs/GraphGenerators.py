@@ -1,3 +1,9 @@
+"""
+Every generator takes a graph keyword: the class to build, UndirectedGraph by
+default or CompactGraph for large networks. RandomEdgeDirections and
+AddWeights keep a CompactGraph compact.
+"""
+
 from Graphs import *
 
 from itertools import combinations
@@ -5,74 +11,115 @@ from random import choice
 from sys import modules
 from functools import partial
 
-from numpy.random import multinomial, uniform
-from numpy import zeros
+from numpy.random import uniform, geometric, randint
+from numpy import arange, cumsum, concatenate, column_stack, zeros, ones, \
+		where, int64
 
 
-def ErdosRenyiGraph(n, p=0.05):
-	"""Each possible edge is included with probability p."""
-	nodes = range(n)
-	edges = filter(lambda x: uniform(0,1) < p, combinations(nodes, 2))
-	return UndirectedGraph(nodes, edges)
+def ErdosRenyiGraph(n, p=0.05, graph=UndirectedGraph):
+	"""
+	Each possible edge is included with probability p.
 
+	Rather than testing every pair, the gaps between included pairs (in
+	combinations order) are drawn from a geometric distribution, so this
+	takes O(n + m) time.
+	"""
+	nodes = range(n)
+	num_pairs = n * (n-1) / 2
+	if p <= 0 or num_pairs == 0:
+		return graph(nodes)
+	if p >= 1:
+		return CompleteGraph(n, graph)
+	expected = num_pairs * p
+	positions = []
+	last = -1
+	while last < num_pairs:
+		gaps = geometric(p, int(expected + 5 * expected**.5) + 10)
+		positions.append(last + cumsum(gaps))
+		last = positions[-1][-1]
+	positions = concatenate(positions)
+	positions = positions[positions < num_pairs]
+	# row src holds pairs (src, src+1), ..., (src, n-1)
+	row_starts = arange(n) * (2*n - arange(n) - 1) / 2
+	src = row_starts.searchsorted(positions, side="right") - 1
+	dst = positions - row_starts[src] + src + 1
+	edges = column_stack([src, dst])
+	return graph(nodes, edges if graph is CompactGraph else edges.tolist())
+
+
+def BarabasiAlbertGraph(n, d, graph=UndirectedGraph):
+	"""
+	Preferential atachment graph on n nodes; most nodes have degree >= d.
 
-def BarabasiAlbertGraph(n, d):
-	"""Preferential atachment graph on n nodes; most nodes have degree >= d."""
+	Each node joins with min(d, node) distinct earlier neighbors, chosen with
+	probability proportional to 1 + degree by drawing from an array in which
+	every node appears once plus once per edge.
+	"""
 	nodes = range(n)
-	edges = set()
-	degrees = zeros(n)
+	repeated = zeros(n + 2*n*d, dtype=int64)
+	filled = 0
+	src = []
+	dst = []
 	for node in nodes:
-		degrees[node] += 1
-		new_edges = set()
-		while degrees[node] <= d and degrees[node] <= node:
-			neighbor = list(multinomial(1, degrees / degrees.sum())).index(1)
-			e = (node, neighbor)
-			if e in new_edges:
-				continue
-			new_edges.add(e)
-			degrees[neighbor] += 1
-			degrees[node] += 1
-		edges.update(new_edges)
-	return UndirectedGraph(nodes, edges)
-
-
-def UniformSpanningTree(n):
-	"""Uniform spanning tree over the complete graph on n edges."""
-	new_nodes = range(n)
-	tree_nodes = set()
-	edges = set()
-	first_node = new_nodes.pop(choice(new_nodes))
-	tree_nodes.add(first_node)
-	while len(tree_nodes) < n:
-		src_node = choice(new_nodes)
-		path = [src_node]
-		while src_node in new_nodes:
-			tree_nodes.add(src_node)
-			new_nodes.pop(new_nodes.index(src_node))
-			dst_node = choice(range(n))
-			while dst_node in path:
-				dst_node = choice(range(n))
-			edges.add(Edge(src_node, dst_node))
-			path.append(dst_node)
-			src_node = dst_node
-	Graph.__init__(self, tree_nodes, edges)
-
-
-def ERGd(n, d):
-	return ErdosRenyiGraph(n, float(d)/n)
+		neighbors = []
+		while len(neighbors) < min(d, node):
+			for neighbor in repeated[randint(0, filled, 2*d)].tolist():
+				if neighbor not in neighbors and len(neighbors) < min(d, node):
+					neighbors.append(neighbor)
+		src.extend([node] * len(neighbors))
+		dst.extend(neighbors)
+		repeated[filled] = node
+		repeated[filled+1 : filled+1+len(neighbors)] = neighbors
+		repeated[filled+1+len(neighbors) : filled+1+2*len(neighbors)] = node
+		filled += 1 + 2*len(neighbors)
+	return graph(nodes, zip(src, dst))
+
+
+def UniformSpanningTree(n, graph=UndirectedGraph):
+	"""
+	Uniform spanning tree over the complete graph on n nodes.
+
+	Uses Wilson's algorithm: loop-erased random walks from each node not yet
+	in the tree until they hit it. Steps are drawn in batches.
+	"""
+	nodes = range(n)
+	in_tree = [False] * n
+	successor = [None] * n
+	edges = []
+	if n:
+		in_tree[randint(n)] = True
+	steps = []
+	for start in nodes:
+		node = start
+		while not in_tree[node]:
+			if not steps:
+				steps = randint(0, n-1, 1024).tolist()
+			step = steps.pop()
+			successor[node] = step + (step >= node)
+			node = successor[node]
+		node = start
+		while not in_tree[node]:
+			in_tree[node] = True
+			edges.append((node, successor[node]))
+			node = successor[node]
+	return graph(nodes, edges)
+
+
+def ERGd(n, d, graph=UndirectedGraph):
+	return ErdosRenyiGraph(n, float(d)/n, graph)
 
 for i in range(1,11):
 	setattr(modules[__name__], 'ERGd'+str(i), partial(ERGd, d=i))
 
 
-def BAGd(n, d):
-	return BarabasiAlbertGraph(n, (d+1)/2)
+def BAGd(n, d, graph=UndirectedGraph):
+	return BarabasiAlbertGraph(n, (d+1)/2, graph)
 
 for i in range(2,11):
 	setattr(modules[__name__], 'BAGd'+str(i), partial(BAGd, d=i))
 
 
-def WattsStrogatzGraph(n, k=4, p=0.1):
+def WattsStrogatzGraph(n, k=4, p=0.1, graph=UndirectedGraph):
 	"""
 	Local connections on a ring lattice with random re-wirings.
 	
@@ -90,30 +137,38 @@ def WattsStrogatzGraph(n, k=4, p=0.1):
 		if uniform() < p:
 			g.addEdge(e[0], choice(list(g.nodes - g.edges[e[0]] - {e[0]})))
 			g.removeEdge(*e)
-	return g
+	if graph is UndirectedGraph:
+		return g
+	return graph(nodes, [e for e in g.iterEdges() if e[0] < e[1]])
 
 
-def BalancedBinaryTree(n):
-	return UndirectedGraph(range(n), [(i, (i-1)/2) for i in range(1,n)])
+def BalancedBinaryTree(n, graph=UndirectedGraph):
+	return graph(range(n), [(i, (i-1)/2) for i in range(1,n)])
 
 
-def LineGraph(n):
-	return UndirectedGraph(range(n), [(i, i+1) for i in range(n-1)])
+def LineGraph(n, graph=UndirectedGraph):
+	return graph(range(n), [(i, i+1) for i in range(n-1)])
 
 
-def RingGraph(n):
-	return UndirectedGraph(range(n), [(i, i+1) for i in range(n-1)] + [(n-1,0)])
+def RingGraph(n, graph=UndirectedGraph):
+	return graph(range(n), [(i, i+1) for i in range(n-1)] + [(n-1,0)])
 
 
-def EmptyGraph(n):
-	return UndirectedGraph(range(n))
+def EmptyGraph(n, graph=UndirectedGraph):
+	return graph(range(n))
 
 
-def CompleteGraph(n):
-	return UndirectedGraph(range(n), combinations(range(n), 2))
+def CompleteGraph(n, graph=UndirectedGraph):
+	return graph(range(n), combinations(range(n), 2))
 
 
 def RandomEdgeDirections(graph):
+	if isinstance(graph, CompactGraph):
+		src, dst = graph.edgeArrays()
+		src, dst = src[src <= dst], dst[src <= dst]
+		flip = uniform(0, 1, len(src)) >= 0.5
+		return CompactGraph(range(len(graph.nodes)), column_stack([ \
+				where(flip, dst, src), where(flip, src, dst)]), True)
 	edges = []
 	for src, dst in set(map(lambda e: tuple(sorted(e)), graph.allEdges())):
 		if uniform(0,1) < 0.5:
@@ -124,6 +179,10 @@ def RandomEdgeDirections(graph):
 
 
 def AddWeights(graph):
+	if isinstance(graph, CompactGraph):
+		src, dst = graph.edgeArrays()
+		return CompactGraph(range(len(graph.nodes)), column_stack([src, \
+				dst]), True, ones(len(src)))
 	edges = [(e[0], e[1], 1) for e in graph.allEdges()]
 	return WeightedDirectedGraph(graph.nodes, edges)
 
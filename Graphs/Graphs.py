@@ -1,4 +1,6 @@
 from heapq import heappush, heappop
+from numpy import array, min_scalar_type, ndarray, zeros, ones, full, \
+		arange, cumsum, bincount, unique, concatenate, repeat, int32, int64
 
 class PathError(Exception):
 	def __init__(self):
@@ -6,9 +8,13 @@ class PathError(Exception):
 
 
 class Graph:
+	search = "bfsPath"
+
 	def __init__(self, nodes=[], edges=[]):
 		self.nodes = set()
 		self.edges = dict()
+		self.distanceCache = dict()
+		self.stats = None
 		for node in nodes:
 			self.addNode(node)
 		for edge in edges:
@@ -18,11 +24,13 @@ class Graph:
 		assert node not in self.nodes, "node " +str(node)+ " already exists"
 		self.nodes.add(node)
 		self.edges[node] = set()
+		self.distanceCache.clear()
 
 	def removeNode(self, node):
 		del self.edges[node]
 		map(lambda s: s.discard(node), self.edges.values())
 		self.nodes.remove(node)
+		self.distanceCache.clear()
 
 	def addEdge(self, *args):
 		raise NotImplementedError("use DirectedGraph or UndirectedGraph")
@@ -33,12 +41,22 @@ class Graph:
 	def adjacent(self, n1, n2):
 		return n2 in self.edges[n1]
 
+	def neighbors(self, node):
+		return self.edges[node]
+
+	def predecessors(self, node):
+		raise NotImplementedError("use DirectedGraph or UndirectedGraph")
+
 	def degree(self, node):
 		return len(self.edges[node])
 
+	def iterEdges(self):
+		for node in self.nodes:
+			for neighbor in self.edges[node]:
+				yield (node, neighbor)
+
 	def allEdges(self):
-		return sum([[(node, neighbor) for neighbor in self.edges[node]] for \
-				node in self.nodes], [])
+		return list(self.iterEdges())
 
 	def numEdges(self):
 		return sum(map(len, self.edges.values()))
@@ -54,18 +72,27 @@ class Graph:
 		return self.__class__.__name__ + ': ' + str(len(self.nodes)) + \
 				' nodes, ' + str(self.numEdges()) + ' edges'
 
-	def shortestPath(self, origin, destination, edgeCost=lambda src,dst: 1, \
-				heuristic=lambda src,dst: 0):
+	def shortestPath(self, origin, destination, edgeCost=None, heuristic=None):
 		"""
 		Find the shortest path between origin and destination.
 
 		The shortest path is found by A* search, so the distance heuristic
-		should be admissable (never overestimating). With the default values for
-		edgeCost and heuristic, the search reduces to BFS.
+		should be admissable (never overestimating). edgeCost defaults to 1 per
+		edge and heuristic to 0. If neither is given, the path has the fewest
+		hops and is found by the unweighted search named by self.search:
+		bfsPath or bidirectionalPath.
 
 		The path is returned as a list of nodes.
 		If no path exists, a PathError is raised.
+
+		If self.stats is a Counter, searches and node expansions are counted.
 		"""
+		if edgeCost is None and heuristic is None:
+			return getattr(self, self.search)(origin, destination)
+		if edgeCost is None:
+			edgeCost = lambda src,dst: 1
+		if heuristic is None:
+			heuristic = lambda src,dst: 0
 		queue = []
 		visited = set()
 		pathCosts = {origin:0}
@@ -78,7 +105,7 @@ class Graph:
 			if node in visited:
 				continue
 			visited.add(node)
-			for neighbor in self.edges[node]:
+			for neighbor in self.neighbors(node):
 				if neighbor in visited:
 					continue
 				newPathCost = pathCosts[node] + edgeCost(node, neighbor)
@@ -89,13 +116,94 @@ class Graph:
 				pathCosts[neighbor] = newPathCost
 				heappush(queue, (heuristic(neighbor, destination) + \
 						newPathCost, neighbor))
+		if self.stats is not None:
+			self.stats["searches"] += 1
+			self.stats["expansions"] += len(visited)
 		if node != destination:
 			raise PathError()
-		path = []
-		while node != None:
-			path = [node] + path
-			node = parents[node]
-		return path
+		return tracePath(parents, destination)
+
+	def bfsPath(self, origin, destination):
+		"""
+		Find a path with the fewest hops by BFS, stopping at destination.
+
+		Each level is expanded in sorted node order, so ties are broken exactly
+		as A* with unit costs breaks them.
+		"""
+		parents = self.bfsTree(origin, destination)[0]
+		if destination not in parents:
+			raise PathError()
+		return tracePath(parents, destination)
+
+	def bfsTree(self, origin, destination):
+		"""
+		The parents of the nodes reached by bfsPath's search, and the levels
+		it expanded: levels[k] lists the nodes k hops from origin, for each k
+		less than the distance to destination (or every k, if destination
+		cannot be reached).
+		"""
+		parents = {origin:None}
+		frontier = [origin]
+		levels = []
+		expansions = 0
+		while frontier and destination not in parents:
+			levels.append(frontier)
+			expansions += len(frontier)
+			nextFrontier = []
+			for node in frontier:
+				for neighbor in self.edges[node]:
+					if neighbor not in parents:
+						parents[neighbor] = node
+						nextFrontier.append(neighbor)
+				if destination in parents:
+					break
+			frontier = sorted(nextFrontier)
+		if self.stats is not None:
+			self.stats["searches"] += 1
+			self.stats["expansions"] += expansions
+		return parents, levels
+
+	def bidirectionalPath(self, origin, destination):
+		"""
+		Find a path with the fewest hops by BFS from both ends.
+
+		The smaller frontier is expanded a level at a time (forward along
+		neighbors, backward along predecessors) until the searches meet. Among
+		the meeting nodes of that level, the one on the shortest path (lowest
+		node on ties) is used, so the path may differ from bfsPath's when
+		several shortest paths exist.
+		"""
+		if origin == destination:
+			return [origin]
+		parents = {origin:None}
+		children = {destination:None}
+		depths = [{origin:0}, {destination:0}]
+		frontiers = [[origin], [destination]]
+		expansions = 0
+		meets = []
+		while frontiers[0] and frontiers[1] and not meets:
+			side = int(len(frontiers[1]) < len(frontiers[0]))
+			links, step = [(parents, self.neighbors), (children, \
+					self.predecessors)][side]
+			depth, otherDepth = depths[side], depths[1 - side]
+			expansions += len(frontiers[side])
+			nextFrontier = []
+			for node in frontiers[side]:
+				for neighbor in step(node):
+					if neighbor not in links:
+						links[neighbor] = node
+						depth[neighbor] = depth[node] + 1
+						nextFrontier.append(neighbor)
+						if neighbor in otherDepth:
+							meets.append(neighbor)
+			frontiers[side] = nextFrontier
+		if self.stats is not None:
+			self.stats["searches"] += 1
+			self.stats["expansions"] += expansions
+		if not meets:
+			raise PathError()
+		meet = min(meets, key=lambda m: (depths[0][m] + depths[1][m], m))
+		return tracePath(parents, meet) + tracePath(children, meet)[::-1][1:]
 
 	def distance(self, n1, n2):
 		try:
@@ -103,26 +211,103 @@ class Graph:
 		except PathError:
 			return -1
 
+	def distanceMatrix(self, cutoff=None):
+		"""
+		Hop distances between all pairs of nodes, as a compact integer array.
+
+		Nodes must be the integers 0..n-1. Entry [n1,n2] matches
+		distance(n1,n2), except that distances beyond cutoff are also -1, so
+		each BFS can stop after cutoff levels. The matrix is computed with one
+		BFS per node and cached until the graph changes.
+		"""
+		if cutoff not in self.distanceCache:
+			n = len(self.nodes)
+			bound = n if cutoff is None else min(cutoff, n)
+			rows = []
+			for source in range(n):
+				row = [-1]*n
+				row[source] = 0
+				frontier = [source]
+				depth = 0
+				while frontier and depth < bound:
+					depth += 1
+					nextFrontier = []
+					for node in frontier:
+						for neighbor in self.edges[node]:
+							if row[neighbor] < 0:
+								row[neighbor] = depth
+								nextFrontier.append(neighbor)
+					frontier = nextFrontier
+				rows.append(row)
+			self.distanceCache[cutoff] = array(rows, dtype=min_scalar_type( \
+					-max(bound, 1))).reshape(n, n)
+		return self.distanceCache[cutoff]
+
+	def distanceRow(self, source, cutoff=None):
+		"""Row source of distanceMatrix(cutoff)."""
+		return self.distanceMatrix(cutoff)[source]
+
 
 class UndirectedGraph(Graph):
 	def addEdge(self, n1, n2):
 		self.edges[n1].add(n2)
 		self.edges[n2].add(n1)
+		self.distanceCache.clear()
 
 	def removeEdge(self, n1, n2):
 		self.edges[n1].remove(n2)
 		self.edges[n2].remove(n1)
+		self.distanceCache.clear()
+
+	def removeNode(self, node):
+		for neighbor in self.edges[node]:
+			self.edges[neighbor].discard(node)
+		del self.edges[node]
+		self.nodes.remove(node)
+		self.distanceCache.clear()
 	
 	def numEdges(self):
 		return Graph.numEdges(self)/2
 
+	def predecessors(self, node):
+		return self.edges[node]
+
 
 class DirectedGraph(Graph):
+	"""
+	inEdges is the reverse of edges: inEdges[dst] holds each src with an
+	edge to dst. It gives predecessors and makes removeNode O(degree).
+	"""
+	def __init__(self, nodes=[], edges=[]):
+		self.inEdges = dict()
+		Graph.__init__(self, nodes, edges)
+
+	def addNode(self, node):
+		Graph.addNode(self, node)
+		self.inEdges[node] = set()
+
+	def removeNode(self, node):
+		for src in self.inEdges[node]:
+			self.edges[src].discard(node)
+		for dst in self.edges[node]:
+			self.inEdges[dst].discard(node)
+		del self.edges[node]
+		del self.inEdges[node]
+		self.nodes.remove(node)
+		self.distanceCache.clear()
+
 	def addEdge(self, src, dst):
 		self.edges[src].add(dst)
+		self.inEdges[dst].add(src)
+		self.distanceCache.clear()
 
 	def removeEdge(self, src, dst):
 		self.edges[src].remove(dst)
+		self.inEdges[dst].remove(src)
+		self.distanceCache.clear()
+
+	def predecessors(self, node):
+		return self.inEdges[node]
 
 
 class WeightedDirectedGraph(DirectedGraph):
@@ -135,14 +320,19 @@ class WeightedDirectedGraph(DirectedGraph):
 		self.weights[(src, dst)] = weight
 
 	def removeNode(self, node):
-		for edge in filter(lambda edge: node in edge, self.weights.keys()):
-			del self.weights[edge]
+		for dst in self.edges[node]:
+			del self.weights[(node, dst)]
+		for src in self.inEdges[node] - set([node]):
+			del self.weights[(src, node)]
 		DirectedGraph.removeNode(self, node)
 
 	def removeEdge(self, src, dst):
 		DirectedGraph.removeEdge(self, src, dst)
 		del self.weights[(src, dst)]
 
+	def edgeWeight(self, src, dst):
+		return self.weights[(src, dst)]
+
 	def allEdges(self):
 		return [(src, dst, self.edgeWeight(src, dst)) for src, dst in \
 				DirectedGraph.allEdges(self)]
@@ -154,3 +344,184 @@ class WeightedDirectedGraph(DirectedGraph):
 				adj[node][neighbor] = self.weights[(node, neighbor)]
 		return adj
 
+
+class CompactGraph(Graph):
+	"""
+	Immutable graph on the nodes 0..n-1, stored in CSR arrays.
+
+	indices[indptr[i]:indptr[i+1]] are the sorted out-neighbors of node i,
+	and weights (None for unweighted graphs) holds the matching edge weights.
+	An undirected graph stores each edge in both directions, as
+	UndirectedGraph does. Duplicate edges are dropped, keeping the first.
+
+	This takes O(n + m) machine words instead of a Python set per node, so
+	it suits large social networks. edges may be a list of pairs or an
+	(m, 2) array.
+	"""
+	def __init__(self, nodes=[], edges=[], directed=False, weights=None):
+		n = len(nodes)
+		assert sorted(nodes) == range(n), "nodes must be 0..n-1"
+		if not isinstance(edges, ndarray):
+			edges = array(list(edges), dtype=int64)
+		edges = edges.astype(int64).reshape(-1, 2)
+		src, dst = edges[:,0], edges[:,1]
+		weights = None if weights is None else array(weights, dtype=float)
+		if not directed:
+			src, dst = concatenate([src, dst]), concatenate([dst, src])
+			if weights is not None:
+				weights = concatenate([weights, weights])
+		keys, first = unique(src * n + dst, return_index=True)
+		self.directed = directed
+		self.indices = (keys % max(n, 1)).astype(int32 if n < 2**31 else int64)
+		self.indptr = zeros(n + 1, dtype=int64)
+		cumsum(bincount(keys // max(n, 1), minlength=n), out=self.indptr[1:])
+		self.weights = None if weights is None else weights[first]
+		self.nodes = set(range(n))
+		self.distanceCache = dict()
+		self.stats = None
+		self.transpose = None
+
+	def addNode(self, node):
+		raise NotImplementedError("CompactGraph is immutable")
+
+	def removeNode(self, node):
+		raise NotImplementedError("CompactGraph is immutable")
+
+	def addEdge(self, *args):
+		raise NotImplementedError("CompactGraph is immutable")
+
+	def removeEdge(self, *args):
+		raise NotImplementedError("CompactGraph is immutable")
+
+	def _row(self, node):
+		return self.indices[self.indptr[node]:self.indptr[node+1]]
+
+	def adjacent(self, n1, n2):
+		row = self._row(n1)
+		i = row.searchsorted(n2)
+		return i < len(row) and row[i] == n2
+
+	def neighbors(self, node):
+		return self._row(node).tolist()
+
+	def predecessors(self, node):
+		if not self.directed:
+			return self.neighbors(node)
+		if self.transpose is None:
+			src, dst = self.edgeArrays()
+			self.transpose = CompactGraph(range(len(self.nodes)), \
+					concatenate([dst, src]).reshape(2, -1).T, True)
+		return self.transpose.neighbors(node)
+
+	def degree(self, node):
+		return int(self.indptr[node+1] - self.indptr[node])
+
+	def edgeWeight(self, src, dst):
+		row = self._row(src)
+		i = row.searchsorted(dst)
+		if i == len(row) or row[i] != dst or self.weights is None:
+			raise KeyError((src, dst))
+		return float(self.weights[self.indptr[src] + i])
+
+	def edgeArrays(self):
+		"""Sources and destinations of all stored edges, in CSR order."""
+		return repeat(arange(len(self.nodes)), self.indptr[1:] - \
+				self.indptr[:-1]), self.indices.astype(int64)
+
+	def iterEdges(self):
+		"""Yield (src, dst) pairs, or (src, dst, weight) if weighted."""
+		for node in range(len(self.nodes)):
+			lo, hi = self.indptr[node], self.indptr[node+1]
+			if self.weights is None:
+				for neighbor in self.indices[lo:hi].tolist():
+					yield (node, neighbor)
+			else:
+				for neighbor, weight in zip(self.indices[lo:hi].tolist(), \
+						self.weights[lo:hi].tolist()):
+					yield (node, neighbor, weight)
+
+	def numEdges(self):
+		if self.directed:
+			return len(self.indices)
+		return len(self.indices)/2
+
+	def adjacencyMatrix(self):
+		n = len(self.nodes)
+		adj = zeros((n, n))
+		src, dst = self.edgeArrays()
+		adj[src, dst] = 1 if self.weights is None else self.weights
+		return adj
+
+	def sparseMatrix(self):
+		"""The adjacency matrix as a scipy.sparse.csr_matrix."""
+		from scipy.sparse import csr_matrix
+		n = len(self.nodes)
+		data = ones(len(self.indices)) if self.weights is None else \
+				self.weights
+		return csr_matrix((data, self.indices, self.indptr), shape=(n, n))
+
+	def bfsPath(self, origin, destination):
+		"""As Graph.bfsPath, reading neighbors from the CSR arrays."""
+		parents = {origin:None}
+		frontier = [origin]
+		expansions = 0
+		while frontier and destination not in parents:
+			expansions += len(frontier)
+			nextFrontier = []
+			for node in frontier:
+				for neighbor in self._row(node).tolist():
+					if neighbor not in parents:
+						parents[neighbor] = node
+						nextFrontier.append(neighbor)
+				if destination in parents:
+					break
+			frontier = sorted(nextFrontier)
+		if self.stats is not None:
+			self.stats["searches"] += 1
+			self.stats["expansions"] += expansions
+		if destination not in parents:
+			raise PathError()
+		return tracePath(parents, destination)
+
+	def distanceMatrix(self, cutoff=None):
+		"""
+		As Graph.distanceMatrix, from one distanceRow per node. This takes
+		n*n bytes or more; code that needs one node's distances at a time
+		should call distanceRow instead.
+		"""
+		if cutoff not in self.distanceCache:
+			self.distanceCache[cutoff] = array([self.distanceRow(source, \
+					cutoff) for source in range(len(self.nodes))]).reshape( \
+					len(self.nodes), len(self.nodes))
+		return self.distanceCache[cutoff]
+
+	def distanceRow(self, source, cutoff=None):
+		"""
+		Row source of distanceMatrix(cutoff), by one BFS that stops after
+		cutoff levels, each gathering the neighbors of the whole frontier
+		from the CSR arrays at once. Rows are not cached.
+		"""
+		n = len(self.nodes)
+		bound = n if cutoff is None else min(cutoff, n)
+		row = full(n, -1, dtype=min_scalar_type(-max(bound, 1)))
+		row[source] = 0
+		frontier = array([source])
+		depth = 0
+		while len(frontier) and depth < bound:
+			depth += 1
+			starts = self.indptr[frontier]
+			counts = self.indptr[frontier + 1] - starts
+			offsets = repeat(starts - cumsum(counts) + counts, counts)
+			reached = self.indices[offsets + arange(counts.sum())]
+			frontier = unique(reached[row[reached] < 0])
+			row[frontier] = depth
+		return row
+
+
+def tracePath(parents, node):
+	"""Follow parents from node back to the root; return the path from it."""
+	path = []
+	while node is not None:
+		path.append(node)
+		node = parents[node]
+	return path[::-1]
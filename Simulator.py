@@ -1,20 +1,36 @@
 #! /usr/bin/env python2.7
 
 import CreditNetworks as CN
+import Graphs.Graphs as G
 
 from argparse import ArgumentParser
+from collections import Counter
+from itertools import imap, chain
+from multiprocessing import Pool
+from time import time
+from hashlib import sha1
+import numpy as np
+import numpy.random as R
+from math import erf, sqrt, isinf
+import random
 import sys
+import os
 import json
 
 
 def read_json(json_folder):
 	with open(json_folder + "/simulation_spec.json") as f:
 		simulator_input = json.load(f)
-	config = simulator_input["configuration"]
-	parameters = {}
+	parameters = parse_config(simulator_input["configuration"])
 	parameters["role"] = simulator_input["assignment"].keys()[0]
 	parameters["strategies"] = simulator_input["assignment"].values()[0]
 	parameters["json_folder"] = json_folder
+	return parameters
+
+
+def parse_config(config):
+	"""Convert the string-valued configuration block into parameters."""
+	parameters = {}
 	parameters["events"] = int(config["events"])
 	parameters["def_alpha"] = float(config["def_alpha"])
 	parameters["def_beta"] = float(config["def_beta"])
@@ -26,39 +42,471 @@ def read_json(json_folder):
 	parameters["price"] = getattr(sys.modules[__name__], config["price"])
 	parameters["def_samples"] = str(config["def_samples"])
 	parameters["social_network"] = str(config["social_network"])
+	parameters["social_graph"] = str(config.get("social_graph", \
+			"UndirectedGraph"))
+	parameters["credit_network"] = str(config.get("credit_network", \
+			"CreditNetwork"))
+	parameters["routing"] = str(config.get("routing", "augmentPayment"))
+	parameters["search"] = str(config.get("search", "bfsPath"))
 	parameters["bank_policy"] = str(config["bank_policy"])
 	parameters["num_banks"] = int(config["num_banks"])
 	parameters["sims_per_sample"] = int(config["sims_per_sample"])
+	parameters["tolerance"] = float(config.get("tolerance", "0"))
+	parameters["confidence"] = float(config.get("confidence", "0.95"))
+	parameters["min_sims_per_sample"] = int(config.get("min_sims_per_sample", \
+			"5"))
+	parameters["max_sims_per_sample"] = int(config.get("max_sims_per_sample", \
+			config["sims_per_sample"]))
+	if parameters["max_sims_per_sample"] < 1:
+		raise ValueError("max_sims_per_sample must be at least 1")
 	parameters["prevent_zeros"] = True if config["prevent_zeros"] == "True" \
 									else False
+	parameters["prevent_zeros_method"] = str(config.get( \
+			"prevent_zeros_method", "conditional"))
+	parameters["vectorized_strategies"] = True if config.get( \
+			"vectorized_strategies", "False") == "True" else False
+	parameters["instrument"] = True if config.get("instrument", "False") == \
+			"True" else False
+	parameters["reachability_index"] = True if config.get( \
+			"reachability_index", "False") == "True" else False
+	parameters["batch_size"] = int(config.get("batch_size", "1"))
+	parameters["hubs"] = str(config.get("hubs", "none"))
+	parameters["path_cache"] = True if config.get("path_cache", "False") == \
+			"True" else False
 	return parameters
 
 
-def parse_args():
+def parse_args(argv=None):
 	parser = ArgumentParser()
 	parser.add_argument("json_folder", type=str)
-	parser.add_argument("samples", type=int)
-	args = parser.parse_args()
+	parser.add_argument("samples", type=int, nargs="?", help="number of " \
+			"observations to write (required unless --export is given)")
+	parser.add_argument("--workers", type=int, default=1, help="number of " \
+			"processes to spread simulations across")
+	parser.add_argument("--seed", type=int, default=None, help="master seed " \
+			"from which every simulation's seed is derived")
+	parser.add_argument("--format", choices=["files", "ndjson"], default= \
+			"files", help="write observation_<i>.json files, or append all " \
+			"observations to " + STREAM_FILE)
+	parser.add_argument("--sync-every", type=int, default=100, help="fsync " \
+			"the ndjson stream after this many observations")
+	parser.add_argument("--export", action="store_true", help="instead of " \
+			"simulating, write observation_<i>.json files from " + STREAM_FILE)
+	parser.add_argument("--world-cache", type=str, default=None, help= \
+			"directory in which sampled worlds are stored and reused")
+	parser.add_argument("--deviation", nargs=2, action="append", default=[], \
+			metavar=("AGENT", "STRATEGY"), help="also simulate the profile " \
+			"in which AGENT plays STRATEGY instead, in the same worlds; " \
+			"repeatable, and reported under each observation's deviations")
+	args = parser.parse_args(argv)
+	if args.samples is None and not args.export:
+		parser.error("samples is required unless --export is given")
 	parameters = read_json(args.json_folder)
 	parameters["samples"] = args.samples
+	parameters["format"] = args.format
+	parameters["sync_every"] = args.sync_every
+	parameters["export"] = args.export
+	parameters["world_cache"] = args.world_cache
+	parameters["workers"] = args.workers
+	parameters["deviations"] = [(int(agent), strategy) for agent, strategy \
+			in args.deviation]
+	parameters["seed"] = R.randint(2**31) if args.seed is None else args.seed
 	return parameters
 
 
-def run_simulator(parameters):
+def seed_simulation(seed, sample, sim, stream=0):
+	"""
+	Seed numpy.random and random for one simulation.
+
+	The seed depends only on the master seed and the simulation's position,
+	so results do not depend on which process runs it. Stream 0 draws the
+	world; stream 1 draws everything that depends on the strategies.
+	"""
+	R.seed([seed, sample, sim] + [stream]*(stream > 0))
+	random.seed(R.randint(2**31))
+
+
+WORLD_PARAMETERS = ["def_alpha", "def_beta", "rate_alpha", "min_value", \
+		"max_value", "min_cost", "max_cost", "social_network", "num_banks", \
+		"seed"]
+
+
+class WorldCache:
+	"""
+	Sampled worlds (see CreditNetworks.InitWorld) stored as .npz files.
+
+	Worlds are keyed by a hash of the parameters they depend on and by the
+	simulation's (sample, sim) position, so runs of different profiles with
+	the same configuration and seed reuse identical worlds.
+	"""
+	def __init__(self, directory):
+		self.directory = directory
+
+	def path(self, parameters, sample, sim):
+		key = [len(parameters["strategies"])] + [parameters[p] for p in \
+				WORLD_PARAMETERS]
+		return os.path.join(self.directory, sha1(json.dumps(key)).hexdigest( \
+				)[:16], str(sample) + "_" + str(sim) + ".npz")
+
+	def load(self, parameters, sample, sim):
+		"""Return the cached world, drawing and storing it if needed."""
+		path = self.path(parameters, sample, sim)
+		if os.path.exists(path):
+			return self.read(path, getattr(G, parameters["social_graph"]))
+		world = CN.InitWorld(parameters)
+		self.write(path, world)
+		return world
+
+	def read(self, path, graph=G.UndirectedGraph):
+		stored = np.load(path)
+		world = dict([(m, stored[m]) for m in ["DP", "TR", "BV", "SC"]])
+		edges = stored["social_edges"]
+		world["social_network"] = graph(range(len(world["DP"])), edges if \
+				graph is G.CompactGraph else edges.tolist())
+		world["defaulters"] = stored["defaulters"].tolist()
+		return world
+
+	def write(self, path, world):
+		"""Write atomically, so concurrent workers never see partial files."""
+		if not os.path.isdir(os.path.dirname(path)):
+			try:
+				os.makedirs(os.path.dirname(path))
+			except OSError:
+				pass
+		edges = [e for e in world["social_network"].iterEdges() if e[0] < e[1]]
+		temp = path[:-4] + "." + str(os.getpid()) + ".tmp.npz"
+		np.savez(temp, DP=world["DP"], TR=world["TR"], BV=world["BV"], \
+				SC=world["SC"], social_edges=np.array(edges, dtype=np.int32 \
+				).reshape(-1, 2), defaulters=np.array(world["defaulters"], \
+				dtype=np.int32))
+		os.rename(temp, path)
+
+
+def simulate(task):
+	"""
+	Run the simulation given by a (parameters, sample, sim) task.
+
+	Returns its payoffs and, if parameters["instrument"] is set, a Counter of
+	routing counters and per-phase times (otherwise None).
+	"""
+	parameters, sample, sim = task
+	return simulate_deviations((dict(parameters, deviations=[]), sample, \
+			sim))[0]
+
+
+def simulate_deviations(task):
+	"""
+	Run a (parameters, sample, sim) task for the base profile and for each
+	(agent, strategy) in parameters["deviations"], returning the list of
+	(payoffs, stats) pairs, base profile first.
+
+	The world, the strategies' criterion matrices and the base network are
+	built once. Each deviation forks the network from a checkpoint taken
+	after construction, replaces only the deviating agent's edges (drawn
+	from stream 2) and continues from the checkpoint's random state, so
+	every profile sees the same transaction schedule. The base profile's
+	result matches a run without deviations.
+	"""
+	parameters, sample, sim = task
+	start = time()
+	world = load_world(parameters, sample, sim)
+	seed_simulation(parameters["seed"], sample, sim, 1)
+	matrices = dict([(m, world[m]) for m in ["DP", "TR", "BV", "SC"]])
+	middle = time()
+	AS = CN.AgentStrategies(matrices, world["social_network"], parameters)
+	crednet = CN.BuildCrednet(CN.InitEdges(matrices, world["social_network"], \
+			parameters, AS), parameters)
+	built = time()
+	if parameters["deviations"]:
+		checkpoint = CN.Checkpoint(crednet)
+	if parameters["instrument"]:
+		crednet.stats = Counter({"simulations":1, "time_world":middle - \
+				start, "time_crednet":built - middle})
+	results = [(CN.SimulateCreditNetwork(crednet, parameters, defaulters= \
+			world["defaulters"], **matrices), crednet.stats)]
+	if not parameters["deviations"]:
+		return results
+	seed_simulation(parameters["seed"], sample, sim, 2)
+	deviation_edges = [AS.get_strategy(strategy)(agent) for agent, strategy \
+			in parameters["deviations"]]
+	for deviation, edges in zip(parameters["deviations"], deviation_edges):
+		built = time()
+		network = checkpoint.fork()[0]
+		CN.ReplaceStrategyEdges(network, deviation[0], edges)
+		if parameters["instrument"]:
+			network.stats = Counter({"simulations":1, "time_crednet":time() \
+					- built})
+		results.append((CN.SimulateCreditNetwork(network, deviate( \
+				parameters, deviation), defaulters=world["defaulters"], \
+				**matrices), network.stats))
+	return results
+
+
+def load_world(parameters, sample, sim):
+	"""Draw (or read from the world cache) the world of one simulation."""
+	seed_simulation(parameters["seed"], sample, sim)
+	if parameters["world_cache"] is None:
+		return CN.InitWorld(parameters)
+	return WorldCache(parameters["world_cache"]).load(parameters, sample, sim)
+
+
+def simulate_batch(tasks):
+	"""
+	Run a list of (parameters, sample, sim) tasks, returning the list of
+	their simulate_deviations results.
+
+	With batch_size > 1 the networks of every task and profile are built as
+	in simulate_deviations, then simulated together by CN.SimulateBatch,
+	which gives the same payoffs. Instrumented runs are not batched.
+	"""
+	parameters = tasks[0][0]
+	if parameters["batch_size"] < 2 or parameters["instrument"]:
+		return map(simulate_deviations, tasks)
+	networks, sims, matrices, defaulters, states = [], [], [], [], []
+	for parameters, sample, sim in tasks:
+		world = load_world(parameters, sample, sim)
+		seed_simulation(parameters["seed"], sample, sim, 1)
+		world_matrices = dict([(m, world[m]) for m in ["DP", "TR", "BV", \
+				"SC"]])
+		AS = CN.AgentStrategies(world_matrices, world["social_network"], \
+				parameters)
+		crednet = CN.BuildCrednet(CN.InitEdges(world_matrices, \
+				world["social_network"], parameters, AS), parameters)
+		state = R.get_state()
+		seed_simulation(parameters["seed"], sample, sim, 2)
+		deviation_edges = [AS.get_strategy(strategy)(agent) for agent, \
+				strategy in parameters["deviations"]]
+		networks.append(crednet)
+		for (agent, strategy), edges in zip(parameters["deviations"], \
+				deviation_edges):
+			networks.append(crednet.fork())
+			CN.ReplaceStrategyEdges(networks[-1], agent, edges)
+		sims.append(profiles(parameters))
+		matrices += [world_matrices] * len(sims[-1])
+		defaulters += [world["defaulters"]] * len(sims[-1])
+		states += [state] * len(sims[-1])
+	payoffs = iter(CN.SimulateBatch(networks, sum(sims, []), matrices, \
+			defaulters, states))
+	return [[(next(payoffs), None) for profile in sim] for sim in sims]
+
+
+def deviate(parameters, deviation):
+	"""Parameters for the profile in which one (agent, strategy) deviates."""
+	agent, strategy = deviation
+	strategies = list(parameters["strategies"])
+	strategies[agent] = strategy
+	return dict(parameters, strategies=strategies)
+
+
+def profiles(parameters):
+	"""Parameters of the base profile followed by each deviation."""
+	return [parameters] + [deviate(parameters, deviation) for deviation in \
+			parameters["deviations"]]
+
+
+def stats_features(stats):
+	"""
+	Observation features for a sample's summed stats.
+
+	Histogram counters, keyed (name, value), become {name: {value: count}}.
+	With the path cache, its hit rate and an estimate of the time it saved
+	are added: each hit is priced at the average miss (a search), less the
+	time spent on the hits.
+	"""
+	features = {}
+	for key, count in stats.items():
+		if isinstance(key, tuple):
+			features.setdefault(key[0], {})[str(key[1])] = count
+		else:
+			features[key] = count
+	hits, misses = stats["path_cache_hits"], stats["path_cache_misses"]
+	if misses:
+		features["path_cache_hit_rate"] = hits / float(hits + misses)
+		features["time_path_cache_saved"] = hits * \
+				stats["time_path_cache_misses"] / misses - \
+				stats["time_path_cache_hits"]
+	return features
+
+
+def average_payoffs(sim_payoffs, parameters):
 	n = len(parameters["strategies"])
 	payoffs = dict(zip(range(n), [0]*n))
-	for sim in range(parameters["sims_per_sample"]):
-		matrices = CN.InitMatrices(parameters)
-		crednet = CN.InitCrednet(matrices, parameters)
-		sim_payoffs = CN.SimulateCreditNetwork(crednet, parameters, **matrices)
-		for agent, value in sim_payoffs.items():
+	for sim in sim_payoffs:
+		for agent, value in sim.items():
 			payoffs[agent] += value
 	for agent in range(n):
-		payoffs[agent] /= parameters["sims_per_sample"]
+		payoffs[agent] /= len(sim_payoffs)
 	return payoffs
 
 
-def write_payoffs(payoffs, parameters, obs_name):
+def run_simulator(parameters, sample=0):
+	sims = range(parameters["sims_per_sample"])
+	return average_payoffs([simulate((parameters, sample, sim))[0] for sim in \
+			sims], parameters)
+
+
+def run_samples(parameters, pool=None):
+	"""
+	Yield, for each sample in order, a list with the averaged payoffs and
+	features of each profile (see profiles), the base profile first. The
+	features of any instrumentation are summed over the sample's
+	simulations; those of adaptive_sample describe the base profile.
+
+	With workers > 1 the simulations are spread over a process pool (the
+	given one, or one made for this run); the per-simulation seeds make the
+	results identical for any worker count. With a positive tolerance, each
+	sample is run by adaptive_sample.
+	"""
+	own_pool = pool is None and parameters["workers"] > 1
+	if own_pool:
+		pool = Pool(parameters["workers"])
+	if parameters["tolerance"] > 0:
+		samples = (adaptive_sample(parameters, i, pool) for i in \
+				range(parameters["samples"]))
+	else:
+		samples = fixed_samples(parameters, pool)
+	for sample, features in samples:
+		results = []
+		for i, profile in enumerate(profiles(parameters)):
+			profile_features = features if i == 0 else {}
+			if parameters["instrument"]:
+				total = Counter()
+				for result in sample:
+					total.update(result[i][1])
+				profile_features.update(stats_features(total))
+			results.append((average_payoffs([result[i][0] for result in \
+					sample], profile), profile_features))
+		yield results
+	if own_pool:
+		pool.close()
+		pool.join()
+
+
+def fixed_samples(parameters, pool):
+	"""Yield the results of each sample's sims_per_sample simulations."""
+	sims = parameters["sims_per_sample"]
+	tasks = [(parameters, i, sim) for i in range(parameters["samples"]) for \
+			sim in range(sims)]
+	batches = chunks(tasks, parameters["batch_size"])
+	if pool is None:
+		results = chain.from_iterable(imap(simulate_batch, batches))
+	else:
+		results = chain.from_iterable(pool.imap(simulate_batch, batches, \
+				max(1, len(batches) / (4 * parameters["workers"]))))
+	for i in range(parameters["samples"]):
+		yield [next(results) for sim in range(sims)], {}
+
+
+def adaptive_sample(parameters, sample, pool):
+	"""
+	Run simulations until each strategy's mean payoff is precise enough.
+
+	A running mean and variance (Welford's method) is kept for each
+	strategy's per-simulation payoff in each profile. Sampling stops once at
+	least min_sims_per_sample have run and every confidence interval
+	half-width is at most tolerance, or after max_sims_per_sample.
+	Simulations run in rounds of batch_size per worker, but the rule is
+	checked after each in order, so the result does not depend on the
+	number of workers or the batch size.
+
+	Returns the simulation results and features recording the number of
+	simulations, the widest half-width and the base profile's half-widths.
+	A half-width is infinite until a strategy has two simulations; it is
+	reported as None, since JSON has no infinity.
+	"""
+	z = normal_quantile(0.5 + parameters["confidence"] / 2)
+	running = {}
+	results = []
+	converged = False
+	batch = max(1, parameters["workers"]) * parameters["batch_size"]
+	while not converged and len(results) < parameters["max_sims_per_sample"]:
+		sims = range(len(results), min(len(results) + batch, \
+				parameters["max_sims_per_sample"]))
+		tasks = [(parameters, sample, sim) for sim in sims]
+		for result in chain.from_iterable((map if pool is None else \
+				pool.map)(simulate_batch, chunks(tasks, \
+				parameters["batch_size"]))):
+			if converged:
+				break
+			results.append(result)
+			for i, profile in enumerate(profiles(parameters)):
+				for strategy, value in strategy_payoffs(result[i][0], \
+						profile).items():
+					count, mean, m2 = running.get((i, strategy), (0, 0., 0.))
+					delta = value - mean
+					mean += delta / (count + 1)
+					running[(i, strategy)] = (count + 1, mean, m2 + delta * \
+							(value - mean))
+			widths = dict([(key, z * sqrt(m2 / (count - 1) / count) if \
+					count > 1 else float("inf")) for key, (count, mean, m2) in \
+					running.items()])
+			converged = len(results) >= parameters["min_sims_per_sample"] and \
+					max(widths.values()) <= parameters["tolerance"]
+	finite = lambda width: None if isinf(width) else width
+	return results, {"simulations":len(results), "ci_half_width": \
+			finite(max(widths.values())), "ci_half_widths":dict([(strategy, \
+			finite(width)) for (i, strategy), width in widths.items() if \
+			i == 0])}
+
+
+def chunks(tasks, size):
+	"""Split tasks into consecutive lists of up to size."""
+	return [tasks[i:i+size] for i in range(0, len(tasks), max(size, 1))]
+
+
+def strategy_payoffs(payoffs, parameters):
+	"""Each strategy's mean payoff in one simulation; defaulters get 0."""
+	totals = Counter()
+	counts = Counter()
+	for agent, strategy in enumerate(parameters["strategies"]):
+		totals[strategy] += payoffs.get(agent, 0.)
+		counts[strategy] += 1
+	return dict([(strategy, totals[strategy] / counts[strategy]) for \
+			strategy in counts])
+
+
+def normal_quantile(p):
+	"""Inverse of the standard normal CDF, by bisection on erf."""
+	low, high = -10., 10.
+	for i in range(100):
+		mid = (low + high) / 2
+		if (1 + erf(mid / sqrt(2))) / 2 < p:
+			low = mid
+		else:
+			high = mid
+	return (low + high) / 2
+
+
+def write_payoffs(payoffs, parameters, obs_name, features={}):
+	write_observation(observation(payoffs, parameters, features), \
+			parameters, obs_name)
+
+
+def write_observation(payoff_json, parameters, obs_name):
+	with open(parameters["json_folder"] + "/observation_" + obs_name + \
+			".json", "w") as payoff_file:
+		json.dump(payoff_json, payoff_file, indent=2)
+
+
+def sample_observation(results, parameters):
+	"""
+	The observation of one sample from run_samples, with an observation for
+	each deviation (tagged with its agent and strategy) under "deviations".
+	The master seed is recorded among the features, so that a run drawn
+	without --seed can be repeated.
+	"""
+	payoff_json = observation(results[0][0], parameters, results[0][1])
+	payoff_json["features"]["seed"] = parameters["seed"]
+	if parameters["deviations"]:
+		payoff_json["deviations"] = [dict(observation(payoffs, profile, \
+				features), agent=agent, strategy=strategy) for (agent, \
+				strategy), (payoffs, features), profile in zip( \
+				parameters["deviations"], results[1:], \
+				profiles(parameters)[1:])]
+	return payoff_json
+
+
+def observation(payoffs, parameters, features={}):
 	payoff_json = {"players":[]}
 	for player in payoffs.keys():
 		payoff_json["players"].append({"role":parameters["role"], \
@@ -70,21 +518,115 @@ def write_payoffs(payoffs, parameters, obs_name):
 				0, "features":{"defaulted":1}})
 	payoff_json["features"] = {"defaults" : len(parameters["strategies"]) - \
 			len(payoffs)}
-	with open(parameters["json_folder"] + "/observation_" + obs_name + \
-			".json", "w") as payoff_file:
-		json.dump(payoff_json, payoff_file, indent=2)
+	payoff_json["features"].update(features)
+	return payoff_json
 
 
-#price functions
-cost = lambda v,c: c
-avg = lambda v,c: (v+c)/2.
+STREAM_FILE = "observations.ndjson"
 
 
-def main():
-	parameters = parse_args()
-	for i in range(parameters["samples"]):
-		payoffs = run_simulator(parameters)
-		write_payoffs(payoffs, parameters, str(i))
+class ObservationStream:
+	"""
+	Append observations to one NDJSON file in json_folder, one per line.
+
+	Writes are buffered; the file is flushed and fsynced every sync_every
+	observations and on close, so a crash loses at most the unsynced tail.
+	A line cut short by a crash is dropped from the file on opening, so
+	appends start cleanly.
+	"""
+	def __init__(self, json_folder, sync_every=100):
+		path = os.path.join(json_folder, STREAM_FILE)
+		drop_torn_line(path)
+		self.file = open(path, "a", 1<<16)
+		self.sync_every = sync_every
+		self.unsynced = 0
+
+	def write(self, obs_name, payoff_json):
+		self.file.write(json.dumps(dict(payoff_json, observation=obs_name)) + \
+				"\n")
+		self.unsynced += 1
+		if self.unsynced >= self.sync_every:
+			self.sync()
+
+	def sync(self):
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.unsynced = 0
+
+	def close(self):
+		self.sync()
+		self.file.close()
+
+
+def drop_torn_line(path, block=1<<16):
+	"""Truncate the file at path (if any) after its last newline."""
+	if not os.path.exists(path):
+		return
+	with open(path, "r+") as f:
+		f.seek(0, os.SEEK_END)
+		end = f.tell()
+		while end > 0:
+			start = max(end - block, 0)
+			f.seek(start)
+			newline = f.read(end - start).rfind("\n")
+			if newline >= 0:
+				end = start + newline + 1
+				break
+			end = start
+		if end < os.fstat(f.fileno()).st_size:
+			f.truncate(end)
+
+
+def read_observations(json_folder):
+	"""
+	Yield (obs_name, payoff_json) from the NDJSON stream in json_folder.
+
+	A final line cut short by a crash is skipped.
+	"""
+	with open(os.path.join(json_folder, STREAM_FILE)) as stream:
+		for line in stream:
+			if not line.endswith("\n"):
+				break
+			payoff_json = json.loads(line)
+			yield str(payoff_json.pop("observation")), payoff_json
+
+
+def export_observations(json_folder):
+	"""
+	Write each streamed observation to observation_<i>.json for EGTA.
+
+	If a stream holds several runs, later observations overwrite earlier ones.
+	"""
+	for obs_name, payoff_json in read_observations(json_folder):
+		with open(os.path.join(json_folder, "observation_" + obs_name + \
+				".json"), "w") as payoff_file:
+			json.dump(payoff_json, payoff_file, indent=2)
+
+
+#price functions (named functions so parameters can be sent to workers)
+def cost(v, c):
+	return c
+
+def avg(v, c):
+	return (v+c)/2.
+
+
+def main(argv=None):
+	parameters = parse_args(argv)
+	if parameters["export"]:
+		export_observations(parameters["json_folder"])
+		return
+	if parameters["format"] == "ndjson":
+		stream = ObservationStream(parameters["json_folder"], \
+				parameters["sync_every"])
+	for i, results in enumerate(run_samples(parameters)):
+		payoff_json = sample_observation(results, parameters)
+		if parameters["format"] == "ndjson":
+			stream.write(str(i), payoff_json)
+		else:
+			write_observation(payoff_json, parameters, str(i))
+	if parameters["format"] == "ndjson":
+		stream.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+#! /usr/bin/env python2.7
+
+"""
+Run one Simulator.py job on the warm simulator server (SimulatorServer.py),
+starting the server first if none is running.
+
+Takes exactly the arguments of Simulator.py and writes the same observation
+files. Only the standard library is imported, so starting this is cheap;
+NumPy and the simulator stay loaded in the server between jobs. The socket
+is SIMULATOR_SOCKET if set, else simulator.sock in a directory only this
+user can enter (see socket_path).
+"""
+
+from tempfile import gettempdir
+from time import time, sleep
+import subprocess
+import socket
+import errno
+import stat
+import json
+import sys
+import os
+
+
+SOCKET_PATH = os.environ.get("SIMULATOR_SOCKET")
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+		"SimulatorServer.py")
+START_TIMEOUT = 60
+RETRIES = 100
+
+
+def socket_path():
+	"""
+	SOCKET_PATH if set, else simulator.sock in crednets-simulator-<uid>
+	under XDG_RUNTIME_DIR (or the temp directory), which is created with
+	mode 0700. A directory there that another user owns or can enter is
+	refused, since whoever controls it could stand in for the server.
+	"""
+	if SOCKET_PATH:
+		return SOCKET_PATH
+	directory = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or \
+			gettempdir(), "crednets-simulator-" + str(os.getuid()))
+	try:
+		os.mkdir(directory, 0700)
+	except OSError as e:
+		if e.errno != errno.EEXIST:
+			raise
+	info = os.lstat(directory)
+	if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+			info.st_mode & 0077:
+		raise IOError(directory + " is not a private directory")
+	return os.path.join(directory, "simulator.sock")
+
+
+def connect(path):
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	client.connect(path)
+	return client
+
+
+def start_server(path):
+	"""Start a detached server and wait until it accepts connections."""
+	with open(os.devnull, "r+") as devnull:
+		subprocess.Popen([sys.executable, SERVER, "--socket", path], stdin= \
+				devnull, stdout=devnull, stderr=devnull, close_fds=True, \
+				preexec_fn=os.setsid)
+	deadline = time() + START_TIMEOUT
+	while True:
+		try:
+			return connect(path)
+		except socket.error:
+			if time() > deadline:
+				raise
+			sleep(0.05)
+
+
+def submit(argv, path=None):
+	"""
+	Send a job to the server at path (socket_path() by default) and return
+	its reply: a dict with the job's exit status and anything it printed.
+
+	A server started from older code than is now on disk answers "stale" and
+	shuts down; the job is then sent to a fresh server. So is a job whose
+	connection a shutting-down server dropped unanswered.
+	"""
+	path = path or socket_path()
+	for attempt in range(RETRIES):
+		try:
+			client = connect(path)
+		except socket.error:
+			client = start_server(path)
+		try:
+			client.sendall(json.dumps({"argv":argv, "cwd":os.getcwd()}) + \
+					"\n")
+			reply = client.makefile().readline()
+		except socket.error:
+			reply = ""
+		client.close()
+		if reply and json.loads(reply)["status"] != "stale":
+			return json.loads(reply)
+		sleep(0.05)
+	raise IOError("no simulator server would take the job")
+
+
+def main():
+	reply = submit(sys.argv[1:])
+	sys.stderr.write(reply["output"])
+	sys.exit(reply["status"])
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python2.7
+
+"""
+Long-lived server that runs Simulator.py jobs sent by SimulatorClient.py.
+
+NumPy, the simulator modules and the registered graph generators are
+loaded once, and a small simulation is run at startup so that lazily
+initialized code is warm too. Each job runs in a process forked from the
+server, so it starts warm and cannot disturb later jobs; it reseeds the
+random generators from the operating system, as a fresh Simulator.py
+process would, so jobs without --seed get different seeds. The server exits
+after idle_timeout seconds without jobs, or as soon as the code on disk is
+newer than the code it loaded.
+"""
+
+import Simulator
+from SimulatorClient import socket_path, connect
+
+from argparse import ArgumentParser
+from SocketServer import ForkingMixIn, UnixStreamServer, StreamRequestHandler
+from StringIO import StringIO
+from glob import glob
+import numpy.random as R
+import traceback
+import random
+import socket
+import errno
+import json
+import sys
+import os
+
+
+def parse_args():
+	parser = ArgumentParser(description="Serve Simulator.py jobs from a " \
+			"unix socket, keeping the simulator loaded between jobs.")
+	parser.add_argument("--socket", type=str, default=None, help="defaults " \
+			"to SimulatorClient.socket_path()")
+	parser.add_argument("--idle-timeout", type=float, default=600, help= \
+			"seconds without jobs after which the server exits")
+	return parser.parse_args()
+
+
+def code_version():
+	"""Latest modification time of the simulator's source files."""
+	directory = os.path.dirname(os.path.abspath(__file__))
+	return max([os.path.getmtime(f) for f in glob(os.path.join(directory, \
+			"*.py")) + glob(os.path.join(directory, "Graphs", "*.py")) + \
+			[os.path.join(directory, "defaults.json")]])
+
+
+def warm_up():
+	"""Run a tiny simulation, without writing anything."""
+	with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+			"defaults.json")) as f:
+		parameters = Simulator.parse_config(json.load(f)["configuration"])
+	parameters.update({"strategies":["BuyRate_highest1_get1", \
+			"DefProb_lowest1_get1", "all0"], "role":"All", "events":10, \
+			"seed":0, "world_cache":None, "social_network":"ERGd2"})
+	Simulator.simulate((parameters, 0, 0))
+
+
+class JobHandler(StreamRequestHandler):
+	"""Run one job (in a forked process) and reply with its outcome."""
+	def handle(self):
+		job = json.loads(self.rfile.readline())
+		output = StringIO()
+		sys.stdout = sys.stderr = output
+		sys.argv = ["Simulator.py"] + job["argv"]
+		R.seed()
+		random.seed()
+		try:
+			os.chdir(job["cwd"])
+			Simulator.main(job["argv"])
+			status = 0
+		except SystemExit as e:
+			status = e.code if isinstance(e.code, int) else int(e.code is \
+					not None)
+		except Exception:
+			traceback.print_exc()
+			status = 1
+		finally:
+			sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+		self.wfile.write(json.dumps({"status":status, "output": \
+				output.getvalue()}) + "\n")
+
+
+class SimulatorServer(ForkingMixIn, UnixStreamServer):
+	def __init__(self, path, idle_timeout):
+		self.version = code_version()
+		self.timeout = idle_timeout
+		self.running = True
+		UnixStreamServer.__init__(self, path, JobHandler)
+		self.inode = os.stat(path).st_ino
+
+	def verify_request(self, request, client_address):
+		"""Turn jobs away once the code has changed, and stop serving."""
+		if code_version() == self.version:
+			return True
+		request.sendall(json.dumps({"status":"stale"}) + "\n")
+		self.running = False
+		return False
+
+	def handle_timeout(self):
+		ForkingMixIn.handle_timeout(self)
+		if not self.active_children:
+			self.running = False
+
+	def serve(self):
+		while self.running:
+			self.handle_request()
+
+
+def bind(path, idle_timeout):
+	"""
+	Create the server, replacing a socket file left behind by a dead server.
+	Returns None if a live server already owns the socket.
+	"""
+	try:
+		return SimulatorServer(path, idle_timeout)
+	except socket.error as e:
+		if e.errno != errno.EADDRINUSE:
+			raise
+	try:
+		connect(path).close()
+		return None
+	except socket.error:
+		os.remove(path)
+		return SimulatorServer(path, idle_timeout)
+
+
+def main():
+	args = parse_args()
+	args.socket = args.socket or socket_path()
+	warm_up()
+	server = bind(args.socket, args.idle_timeout)
+	if server is None:
+		return
+	try:
+		server.serve()
+	finally:
+		server.server_close()
+		# a newer server may already have replaced a stale socket file
+		if os.path.exists(args.socket) and os.stat(args.socket).st_ino == \
+				server.inode:
+			os.remove(args.socket)
+
+
+if __name__ == "__main__":
+	main()
@@ -3,6 +3,9 @@ from functools import partial
 from operator import ge, le
 from random import sample
 
+from numpy import array, arange, tile, zeros, isinf, partition, \
+		flatnonzero, concatenate, argsort, int64
+
 try:
 	from numpy.random import binomial
 except ImportError:
@@ -17,13 +20,33 @@ class AgentStrategies:
 	def_damples..'-' seperated string specifying DefProb posterior estimation
 	def_alpha....alpha parameter for default probability beta-distribution
 	def_beta.....beta parameter for default probability beta-distribution
+	vectorized_strategies..whether criterion strategies are evaluated on
+			whole criterion matrices instead of pair by pair (the same
+			edges, except where DefProb samples: see DefProbMatrix)
+
+	Each criterion method has a <criterion>Matrix counterpart giving its
+	value for every (agent, other) pair; these are computed once and cached.
 	"""
 	def __init__(self, matrices, social_network, params):
 		self.matrices = matrices
 		self.social_network = social_network
 		self.params = params
 		self.nodes = sorted(social_network.nodes)
+		self.nodeArray = array(self.nodes, dtype=int64)
 		self.def_samples = map(float, params["def_samples"].split(","))
+		self.criterionMatrices = dict()
+		self.lastDistances = (None, None)
+
+	def distances(self, agent):
+		"""
+		The social network's distanceRow from agent, cut off after the last
+		def_samples entry. The last row is kept, since criteria are evaluated
+		agent by agent; a CompactGraph never builds the n x n matrix.
+		"""
+		if self.lastDistances[0] != agent:
+			self.lastDistances = (agent, self.social_network.distanceRow( \
+					agent, len(self.def_samples) - 1))
+		return self.lastDistances[1]
 
 	def others(self, agent):
 		return self.social_network.nodes - {agent}
@@ -36,9 +59,8 @@ class AgentStrategies:
 		return self.matrices["DP"][other]
 
 	def DefProb(self, agent, other):
-		d = self.social_network.distance(agent, other)
-		if d >= len(self.def_samples):
-			d = -1
+		# distances past the last def_samples entry use that entry, like -1
+		d = int(self.distances(agent)[other])
 		num_samples = self.def_samples[d]
 		if 0 < num_samples < float('inf'):
 			pos_samples = binomial(num_samples, self.matrices["DP"][other])
@@ -71,6 +93,62 @@ class AgentStrategies:
 	def TradeProfit(self, agent, other):
 		return self.TradeValue(agent, other) - self.TradeCost(agent, other)
 
+	#criterion matrices
+	def criterionMatrix(self, criterion):
+		if criterion not in self.criterionMatrices:
+			self.criterionMatrices[criterion] = getattr(self, criterion + \
+					"Matrix")()
+		return self.criterionMatrices[criterion]
+
+	def IndexMatrix(self):
+		return tile(arange(len(self.nodes), dtype=float), (len(self.nodes), 1))
+
+	def TrueDefProbMatrix(self):
+		return tile(self.matrices["DP"], (len(self.nodes), 1))
+
+	def DefProbMatrix(self):
+		"""
+		Built a row at a time from distances, drawing the samples in the
+		same order as one draw over the whole matrix would. Each sampled
+		estimate is drawn once, where DefProb draws a new one each time it
+		is called, so with finite def_samples the chosen edges differ.
+		"""
+		estimates = zeros((len(self.nodes), len(self.nodes)))
+		def_probs = self.matrices["DP"]
+		for agent in self.nodes:
+			num_samples = array(self.def_samples)[self.distances(agent)]
+			sampled = (0 < num_samples) & ~isinf(num_samples)
+			pos_samples = zeros(len(self.nodes))
+			pos_samples[sampled] = binomial(num_samples[sampled].astype( \
+					int64), def_probs[sampled])
+			row = estimates[agent]
+			row[:] = (self.params["def_alpha"] + pos_samples) / ( \
+					self.params["def_alpha"] + self.params["def_beta"] + \
+					num_samples)
+			row[isinf(num_samples)] = def_probs[isinf(num_samples)]
+		return estimates
+
+	def BuyRateMatrix(self):
+		return self.matrices["TR"]
+
+	def BuyValueMatrix(self):
+		return self.matrices["BV"]
+
+	def TradeValueMatrix(self):
+		return self.BuyValueMatrix() * self.BuyRateMatrix()
+
+	def SellRateMatrix(self):
+		return self.matrices["TR"].T
+
+	def SellCostMatrix(self):
+		return self.matrices["SC"].T
+
+	def TradeCostMatrix(self):
+		return self.SellCostMatrix() * self.SellRateMatrix()
+
+	def TradeProfitMatrix(self):
+		return self.TradeValueMatrix() - self.TradeCostMatrix()
+
 	#generic strategies
 	def all_k(self, agent, k):
 		return [(agent, other, k) for other in self.others(agent)]
@@ -87,6 +165,32 @@ class AgentStrategies:
 	def random_n_get_k(self, agent, n, k):
 		return [(agent, other, k) for other in sample(self.others(agent), n)]
 
+	#vectorized generic strategies (same edges as the pairwise versions for
+	#deterministic criteria; sampled DefProb estimates are drawn once)
+	def best_n_get_k_matrix(self, agent, n, k, criterion, reverse):
+		others = self.nodeArray[self.nodeArray != agent]
+		values = self.criterionMatrix(criterion)[agent, others]
+		if reverse:
+			values = -values
+		if n <= 0:
+			return []
+		if n < len(others):
+			# sorted() is stable, so ties at the cutoff go to the lowest nodes
+			kth = partition(values, n-1)[n-1]
+			chosen = flatnonzero(values < kth)
+			ties = flatnonzero(values == kth)[:n - len(chosen)]
+			chosen = concatenate([chosen, ties])
+			chosen.sort()
+		else:
+			chosen = arange(len(others))
+		chosen = chosen[argsort(values[chosen], kind="mergesort")]
+		return [(agent, other, k) for other in others[chosen].tolist()]
+
+	def thresh_t_get_k_matrix(self, agent, t, k, criterion, comparator):
+		others = self.nodeArray[self.nodeArray != agent]
+		chosen = comparator(self.criterionMatrix(criterion)[agent, others], t)
+		return [(agent, other, k) for other in others[chosen].tolist()]
+
 	#explicit strategies
 	def all0(self, agent):
 		return []
@@ -99,9 +203,16 @@ class AgentStrategies:
 			return getattr(self, strategy)
 
 		s = strategy.split("_")
+		best_n_get_k = self.best_n_get_k
+		thresh_t_get_k = self.thresh_t_get_k
 		if hasattr(self, s[0]):
 			criterion = getattr(self, s[0])
 			k = float(s[-1][3:])
+			if self.params["vectorized_strategies"] and \
+					hasattr(self, s[0] + "Matrix"):
+				criterion = s[0]
+				best_n_get_k = self.best_n_get_k_matrix
+				thresh_t_get_k = self.thresh_t_get_k_matrix
 
 		#generate allk strategies
 		if strategy.startswith("all"):
@@ -117,25 +228,25 @@ class AgentStrategies:
 		#generate criterion_lowestn_getk strategies
 		elif "lowest" in strategy and "get" in strategy:
 			n = int(s[1][6:])
-			strat = partial(self.best_n_get_k, n=n, k=k, \
+			strat = partial(best_n_get_k, n=n, k=k, \
 					criterion=criterion, reverse=False)
 
 		#generate criterion_highestn_getk strategies
 		elif "highest" in strategy and "get" in strategy:
 			n = int(s[1][7:])
-			strat = partial(self.best_n_get_k, n=n, k=k, \
+			strat = partial(best_n_get_k, n=n, k=k, \
 					criterion=criterion, reverse=True)
 
 		#generate criterion_belowt_getk strategies
 		elif "below" in strategy and "get" in strategy:
 			t = float(s[1][5:])
-			strat = partial(self.thresh_t_get_k, t=t, k=k, \
+			strat = partial(thresh_t_get_k, t=t, k=k, \
 					criterion=criterion, comparator=le)
 
 		#generate criterion_abovet_getk strategies
 		elif "above" in strategy and "get" in strategy:
 			t = float(s[1][5:])
-			strat = partial(self.thresh_t_get_k, t=t, k=k, \
+			strat = partial(thresh_t_get_k, t=t, k=k, \
 					criterion=criterion, comparator=ge)
 
 		try:
@@ -0,0 +1,157 @@
+#! /usr/bin/env python2.7
+
+import Simulator
+
+from argparse import ArgumentParser
+from itertools import product
+from multiprocessing import Pool
+import numpy.random as R
+import json
+import sys
+import os
+
+
+RESULTS_FILE = "results.ndjson"
+SWEEP_FILE = "sweep.json"
+
+
+def parse_args(argv=None):
+	parser = ArgumentParser(description="Simulate every point of a " \
+			"parameter sweep, writing each point's observations to one " \
+			"file keyed by its parameter values. Points already there are " \
+			"skipped, so an interrupted sweep can be restarted.")
+	parser.add_argument("sweep_spec", type=str, help="json file like " \
+			"simulation_spec.json, plus a 'grid' of parameter: [values] " \
+			"(every combination is run) and/or a list of 'points' of " \
+			"parameter: value, each combined with the grid")
+	parser.add_argument("output", type=str, help="directory for " + \
+			RESULTS_FILE + " and the world cache")
+	parser.add_argument("samples", type=int)
+	parser.add_argument("--workers", type=int, default=1, help="number of " \
+			"processes to spread each point's simulations across")
+	parser.add_argument("--seed", type=int, default=None, help="master " \
+			"seed (default: the one the output was started with, else random)")
+	parser.add_argument("--world-cache", type=str, default=None, help= \
+			"directory in which sampled worlds are stored and reused " \
+			"(default: <output>/worlds)")
+	return parser.parse_args(argv)
+
+
+def sweep_points(spec):
+	"""
+	Every point of the sweep, as a dict of swept parameter values: each of
+	spec["points"] (default a single empty point) updated with each
+	combination of spec["grid"].
+	"""
+	grid = spec.get("grid", {})
+	keys = sorted(grid)
+	points = []
+	for base in spec.get("points", [{}]):
+		for values in product(*[grid[key] for key in keys]):
+			point = dict(base)
+			point.update(zip(keys, values))
+			points.append(point)
+	return points
+
+
+def point_key(point):
+	return json.dumps(point, sort_keys=True)
+
+
+def point_parameters(spec, point, samples, workers, seed, world_cache):
+	"""Simulator parameters for one point of the sweep."""
+	config = dict(spec["configuration"])
+	config.update([(key, str(value)) for key, value in point.items()])
+	parameters = Simulator.parse_config(config)
+	unknown = set(point) - set(parameters)
+	if unknown:
+		raise KeyError("not configuration parameters: " + ", ".join(unknown))
+	parameters["role"] = spec["assignment"].keys()[0]
+	parameters["strategies"] = spec["assignment"].values()[0]
+	parameters["deviations"] = [(int(agent), strategy) for agent, strategy \
+			in spec.get("deviations", [])]
+	parameters["samples"] = samples
+	parameters["workers"] = workers
+	parameters["seed"] = seed
+	parameters["world_cache"] = world_cache
+	return parameters
+
+
+def completed_points(output):
+	"""
+	Keys of the points in output's results. A line cut short by an
+	interrupted write is dropped from the file, so appends start cleanly.
+	"""
+	path = os.path.join(output, RESULTS_FILE)
+	if not os.path.exists(path):
+		return set()
+	keys = set()
+	with open(path, "r+") as results:
+		end = 0
+		for line in iter(results.readline, ""):
+			if not line.endswith("\n"):
+				results.truncate(end)
+				break
+			keys.add(json.loads(line)["key"])
+			end = results.tell()
+	return keys
+
+
+def sweep_seed(output, seed):
+	"""
+	The master seed of the sweep in output: recorded when the sweep starts,
+	so that restarted sweeps draw the same worlds.
+	"""
+	path = os.path.join(output, SWEEP_FILE)
+	if os.path.exists(path):
+		with open(path) as f:
+			recorded = json.load(f)["seed"]
+		if seed is not None and seed != recorded:
+			raise ValueError(output + " was swept with seed " + str(recorded))
+		return recorded
+	if seed is None:
+		seed = R.randint(2**31)
+	with open(path + ".tmp", "w") as f:
+		json.dump({"seed":seed}, f)
+	os.rename(path + ".tmp", path)
+	return seed
+
+
+def main(argv=None):
+	"""
+	Points run one after another, each spreading its simulations over the
+	shared pool. All points use the same seeds and one world cache. Worlds
+	depend only on Simulator.WORLD_PARAMETERS, so points that differ in
+	other parameters (price, routing, events, ...) reuse the same worlds.
+	"""
+	args = parse_args(argv)
+	with open(args.sweep_spec) as f:
+		spec = json.load(f)
+	if not os.path.isdir(args.output):
+		os.makedirs(args.output)
+	seed = sweep_seed(args.output, args.seed)
+	world_cache = args.world_cache or os.path.join(args.output, "worlds")
+	done = completed_points(args.output)
+	pool = Pool(args.workers) if args.workers > 1 else None
+	with open(os.path.join(args.output, RESULTS_FILE), "a") as results:
+		for point in sweep_points(spec):
+			key = point_key(point)
+			if key in done:
+				continue
+			parameters = point_parameters(spec, point, args.samples, \
+					args.workers, seed, world_cache)
+			observations = [Simulator.sample_observation(sample, parameters) \
+					for sample in Simulator.run_samples(parameters, pool)]
+			results.write(json.dumps({"key":key, "parameters":point, \
+					"samples":args.samples, "observations":observations}) + "\n")
+			results.flush()
+			os.fsync(results.fileno())
+			done.add(key)
+			print >> sys.stderr, key
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+
+if __name__ == "__main__":
+	main()
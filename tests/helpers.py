@@ -0,0 +1,20 @@
+import json
+import os
+
+import Simulator
+
+
+def configuration(**settings):
+	"""The configuration block of defaults.json, with settings replaced."""
+	with open(os.path.join(os.path.dirname(__file__), "..", \
+			"defaults.json")) as f:
+		return dict(json.load(f)["configuration"], **settings)
+
+
+def parameters(**settings):
+	"""Simulator parameters from defaults.json, for a small, quick run."""
+	p = Simulator.parse_config(configuration())
+	p.update(role="All", seed=3, world_cache=None, events=2000, \
+			strategies=["BuyRate_highest2_get2", "DefProb_lowest2_get2"] * 20)
+	p.update(settings)
+	return p
@@ -0,0 +1,140 @@
+import unittest
+import random
+import shutil
+import tempfile
+
+import CreditNetworks as CN
+import Simulator
+from helpers import parameters
+
+
+class ArrayCreditNetworkTest(unittest.TestCase):
+	"""ArrayCreditNetwork behaves exactly as CreditNetwork, in both layouts."""
+
+	def setUp(self):
+		self.denseNodes = CN.ArrayCreditNetwork.DENSE_NODES
+
+	def tearDown(self):
+		CN.ArrayCreditNetwork.DENSE_NODES = self.denseNodes
+
+	def layouts(self):
+		for denseNodes in [self.denseNodes, 0]:
+			CN.ArrayCreditNetwork.DENSE_NODES = denseNodes
+			yield denseNodes
+
+	def test_payoffs(self):
+		for layout in self.layouts():
+			for social_network in ["ErdosRenyiGraph", "EmptyGraph"]:
+				for routing in ["augmentPayment", "flowPayment"]:
+					payoffs = []
+					for credit_network in ["CreditNetwork", \
+							"ArrayCreditNetwork"]:
+						p = parameters(credit_network=credit_network, \
+								social_network=social_network, \
+								routing=routing, num_banks=2)
+						payoffs.append(Simulator.simulate((p, 0, 1))[0])
+					self.assertEqual(payoffs[0], payoffs[1])
+
+	def test_edits(self):
+		for layout in self.layouts():
+			rng = random.Random(1)
+			nodes = range(-2, 60)
+			edges = [(a, b, float(rng.randint(1, 3))) for a in nodes for b \
+					in nodes if a != b and rng.random() < 0.03]
+			networks = [CN.CreditNetwork(nodes, edges), \
+					CN.ArrayCreditNetwork(nodes, edges)]
+			for step in range(1500):
+				alive = sorted(networks[0].nodes)
+				a, b = rng.sample(alive, 2)
+				op = rng.random()
+				if op < 0.3:
+					for N in networks:
+						N.addEdge(a, b, 2.)
+				elif op < 0.4 and networks[0].adjacent(a, b):
+					for N in networks:
+						N.removeEdge(a, b)
+				elif op < 0.41 and len(alive) > 10:
+					for N in networks:
+						N.removeNode(a)
+				elif op < 0.45:
+					networks = [N.fork() for N in networks]
+				else:
+					routed = []
+					for N in networks:
+						try:
+							N.routePayment(a, b, 1.)
+							routed.append(True)
+						except CN.CreditError:
+							routed.append(False)
+					self.assertEqual(routed[0], routed[1])
+				self.assertEqual(sorted(networks[0].allEdges()), \
+						networks[1].allEdges())
+				self.assertEqual(sorted(networks[0].predecessors(b)), \
+						sorted(networks[1].predecessors(b)))
+				self.assertEqual(networks[0].degree(b), \
+						networks[1].degree(b))
+
+	def test_graph_methods(self):
+		for layout in self.layouts():
+			rng = random.Random(3)
+			nodes = range(40)
+			edges = [(a, b, float(rng.randint(1, 3))) for a in nodes for b \
+					in nodes if a != b and rng.random() < 0.05]
+			networks = [CN.CreditNetwork(nodes, edges), \
+					CN.ArrayCreditNetwork(nodes, edges)]
+			for step in range(30):
+				self.assertEqual(sorted(networks[0].iterEdges()), \
+						sorted(networks[1].iterEdges()))
+				self.assertEqual(networks[0].adjacencyMatrix(), \
+						networks[1].adjacencyMatrix())
+				for cutoff in [None, 2]:
+					self.assertEqual(networks[0].distanceMatrix(cutoff). \
+							tolist(), networks[1].distanceMatrix(cutoff). \
+							tolist())
+					self.assertEqual(networks[0].distanceRow(5, cutoff). \
+							tolist(), networks[1].distanceRow(5, cutoff). \
+							tolist())
+				self.assertEqual(networks[0].distance(1, 7), \
+						networks[1].distance(1, 7))
+				self.assertEqual(networks[0].numEdges(), networks[1].numEdges())
+				a, b = rng.sample(nodes, 2)
+				for N in networks:
+					if step % 3:
+						try:
+							N.routePayment(a, b, 1.)
+						except CN.CreditError:
+							pass
+					else:
+						N.addEdge(a, b, 1.)
+
+	def test_remove_defaulters(self):
+		for layout in self.layouts():
+			edges = [(0, 1, 2.), (2, 1, 3.), (1, 2, 1.), (3, 0, 1.)]
+			results = []
+			for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+				network = cls(range(4), edges)
+				payoffs = dict.fromkeys(range(4), 0.)
+				CN.RemoveDefaulters(network, payoffs, [1, 3])
+				results.append((payoffs, sorted(network.allEdges())))
+			self.assertEqual(results[0], ({0:-2., 2:-3.}, []))
+			self.assertEqual(results[0], results[1])
+
+	def test_fork_of_memory_map(self):
+		for layout in self.layouts():
+			edges = [(i, (i + 1) % 10, 1.) for i in range(10)]
+			directory = tempfile.mkdtemp()
+			try:
+				CN.ArrayCreditNetwork(range(10), edges).save(directory)
+				loaded = CN.LoadCrednet(directory, "r")
+				fork = loaded.fork()
+				fork.addEdge(0, 5, 2.)
+				fork.addEdge(5, 0, 2.)
+				fork.routePayment(5, 0, 1.)
+				self.assertEqual(fork.edgeWeight(0, 5), 1.)
+				self.assertEqual(loaded.allEdges(), edges)
+			finally:
+				shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+	unittest.main()
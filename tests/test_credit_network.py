@@ -0,0 +1,420 @@
+import unittest
+import random
+import os
+import shutil
+import tempfile
+
+from numpy import array
+import numpy.random as R
+import CreditNetworks as CN
+import Simulator
+from helpers import parameters
+
+
+class ReachabilityIndexTest(unittest.TestCase):
+	def test_payoffs(self):
+		for strategies in [["BuyRate_highest2_get2"], ["DefProb_lowest2_get2", \
+				"all0"]]:
+			payoffs = [Simulator.simulate((parameters(strategies=strategies * \
+					20, reachability_index=reachability), 0, 1))[0] for \
+					reachability in [False, True]]
+			self.assertEqual(payoffs[0], payoffs[1])
+
+	def test_rebuilds_back_off(self):
+		network = CN.CreditNetwork(range(3), [(0, 1, 1.), (1, 2, 1.)])
+		index = CN.ReachabilityIndex(network)
+		self.assertTrue(index.reaches(0, 2))
+		for i in range(index.patience):
+			index.miss()
+		self.assertTrue(index.reaches(0, 2))
+		self.assertEqual(index.limit, 2 * index.patience)
+		self.assertFalse(index.reaches(2, 0))
+		for i in range(2 * index.patience):
+			index.miss()
+		index.reaches(0, 2)
+		self.assertEqual(index.limit, index.patience)
+
+
+class DefaultsTest(unittest.TestCase):
+	def setUp(self):
+		self.group = [0, 1, 2]
+		self.DP = array([0.6, 0.7, 0.8])
+
+	def frequencies(self, draw, n=20000):
+		counts = {}
+		for i in range(n):
+			key = tuple(draw())
+			counts[key] = counts.get(key, 0) + 1
+		return dict([(key, count / float(n)) for key, count in \
+				counts.items()])
+
+	def rejected(self):
+		"""Rejection sampling: redraw until some agent does not default."""
+		while True:
+			defaulted = [a for a in self.group if R.random_sample() < \
+					self.DP[a]]
+			if len(defaulted) < len(self.group):
+				return defaulted
+
+	def test_conditional_matches_rejection(self):
+		R.seed(8)
+		exact = {}
+		for mask in range(7):
+			defaulted = tuple([a for a in self.group if mask >> a & 1])
+			exact[defaulted] = reduce(lambda x, a: x * (self.DP[a] if a in \
+					defaulted else 1 - self.DP[a]), self.group, 1.) / (1 - \
+					self.DP.prod())
+		for draw in [lambda: CN.ConditionalDefaults(self.group, self.DP), \
+				self.rejected]:
+			frequencies = self.frequencies(draw)
+			self.assertEqual(sorted(frequencies), sorted(exact))
+			for key, p in exact.items():
+				self.assertAlmostEqual(frequencies[key], p, delta=4 * \
+						(p * (1 - p) / 20000) ** .5)
+
+	def test_prevent_zeros(self):
+		network = CN.CreditNetwork(range(-1, 6))
+		DP = array([0.9] * 6 + [0.5])
+		for method in ["conditional", "redraw"]:
+			p = parameters(prevent_zeros=True, prevent_zeros_method=method, \
+					strategies=["a", "a", "b", "b", "b", "c"])
+			R.seed(9)
+			for i in range(200):
+				defaulted = set(CN.DrawDefaulters(network, p, DP))
+				for group in [[0, 1], [2, 3, 4], [5]]:
+					self.assertFalse(defaulted.issuperset(group))
+		self.assertRaises(ValueError, CN.DrawDefaulters, network, \
+				parameters(prevent_zeros_method="condtional"), DP)
+
+
+class JournalTest(unittest.TestCase):
+	"""Rollback restores a network exactly, in both network classes."""
+
+	def network(self, cls, seed):
+		rng = random.Random(seed)
+		nodes = range(25)
+		return cls(nodes, [(a, b, float(rng.randint(1, 4))) for a in nodes \
+				for b in nodes if a != b and rng.random() < 0.15]), rng
+
+	def change(self, network, rng, steps):
+		"""Random payments, some of which fail, and edge edits."""
+		for step in range(steps):
+			a, b = rng.sample(sorted(network.nodes), 2)
+			op = rng.random()
+			if op < 0.15:
+				network.addEdge(a, b, float(rng.randint(1, 4)))
+			elif op < 0.25 and network.adjacent(a, b):
+				network.removeEdge(a, b)
+			else:
+				try:
+					network.routePayment(a, b, rng.choice([0.5, 2., 6.]))
+				except CN.CreditError:
+					pass
+
+	def test_rollback(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			network, rng = self.network(cls, 4)
+			for trial in range(20):
+				before = sorted(network.allEdges())
+				network.begin()
+				self.change(network, rng, 30)
+				network.rollback()
+				self.assertEqual(sorted(network.allEdges()), before)
+				self.change(network, rng, 5)
+
+	def test_nested(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			network, rng = self.network(cls, 5)
+			before = sorted(network.allEdges())
+			network.begin()
+			self.change(network, rng, 20)
+			outer = sorted(network.allEdges())
+			network.begin()
+			self.change(network, rng, 20)
+			network.rollback()
+			self.assertEqual(sorted(network.allEdges()), outer)
+			network.begin()
+			self.change(network, rng, 20)
+			inner = sorted(network.allEdges())
+			network.commit()
+			self.assertEqual(sorted(network.allEdges()), inner)
+			network.rollback()
+			self.assertEqual(sorted(network.allEdges()), before)
+			self.assertEqual(network.journal, None)
+
+	def test_probe(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			network, rng = self.network(cls, 6)
+			for trial in range(200):
+				a, b = rng.sample(sorted(network.nodes), 2)
+				amount = rng.choice([0.5, 2., 6.])
+				before = sorted(network.allEdges())
+				probed = network.probePayment(a, b, amount)
+				self.assertEqual(sorted(network.allEdges()), before)
+				try:
+					network.routePayment(a, b, amount)
+					self.assertTrue(probed)
+				except CN.CreditError:
+					self.assertFalse(probed)
+
+
+class FlowPaymentTest(unittest.TestCase):
+	def network(self, cls, seed, routing="augmentPayment"):
+		rng = random.Random(seed)
+		nodes = range(25)
+		return cls(nodes, [(a, b, float(rng.randint(1, 4))) for a in nodes \
+				for b in nodes if a != b and rng.random() < 0.1], routing), rng
+
+	def augmented(self, network, origin, destination):
+		"""The flow of repeated shortest augmenting paths, on a fork."""
+		network = network.fork()
+		flow = 0.
+		while True:
+			try:
+				path = network.bfsPath(origin, destination)
+			except CN.PathError:
+				return flow
+			capacity = network.capacity(path)
+			for src, dst in zip(path[1:], path):
+				network.makePayment(src, dst, capacity)
+			flow += capacity
+
+	def test_max_flow(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			network, rng = self.network(cls, 10)
+			for trial in range(100):
+				a, b = rng.sample(range(25), 2)
+				before = network.allEdges()
+				flow = network.maxFlow(a, b)
+				self.assertAlmostEqual(flow, self.augmented(network, a, b))
+				self.assertEqual(network.maxFlow(a, b, 1.5), min(flow, 1.5))
+				self.assertEqual(network.allEdges(), before)
+
+	def test_same_as_augment(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			augment = self.network(cls, 11)[0]
+			flow, rng = self.network(cls, 11, "flowPayment")
+			writes = []
+			makePayment = flow.makePayment
+			flow.makePayment = lambda *args: writes.append(args) or \
+					makePayment(*args)
+			for trial in range(500):
+				a, b = rng.sample(range(25), 2)
+				amount = rng.choice([0.5, 2., 5., 9.])
+				routed = []
+				for N in [augment, flow]:
+					del writes[:]
+					try:
+						N.routePayment(a, b, amount)
+						routed.append(True)
+					except CN.CreditError:
+						routed.append(False)
+				self.assertEqual(routed[0], routed[1])
+				if not routed[1]:
+					self.assertEqual(writes, [])
+				self.assertEqual(sorted(augment.allEdges()), \
+						sorted(flow.allEdges()))
+
+
+class RoutingCacheTest(unittest.TestCase):
+	"""The path cache and hubs route exactly as a plain search does."""
+
+	variants = [{}, {"pathCache":True}, {"hubs":[-2, -1]}, {"pathCache":True, \
+			"hubs":[-2, -1]}]
+
+	def test_mutated_networks(self):
+		for cls in [CN.CreditNetwork, CN.ArrayCreditNetwork]:
+			rng = random.Random(2)
+			agents = range(30)
+			edges = [(a, b, float(rng.randint(1, 3))) for a in agents for b \
+					in agents if a != b and rng.random() < 0.05] + [(a, b, \
+					2.) for bank in [-2, -1] for a, b in [(bank, agent) for \
+					agent in agents] + [(agent, bank) for agent in agents]]
+			networks = [cls(range(-2, 30), edges, **v) for v in self.variants]
+			for step in range(2000):
+				alive = sorted(networks[0].nodes)
+				a, b = rng.sample(alive, 2)
+				op = rng.random()
+				if op < 0.2:
+					weight = float(rng.randint(1, 3))
+					for N in networks:
+						N.addEdge(a, b, weight)
+				elif op < 0.3 and networks[0].adjacent(a, b):
+					for N in networks:
+						N.removeEdge(a, b)
+				elif op < 0.305 and a >= 0 and len(alive) > 10:
+					for N in networks:
+						N.removeNode(a)
+				elif op < 0.32:
+					networks = [N.fork() for N in networks]
+				else:
+					amount = rng.choice([0.5, 1., 3.])
+					routed = []
+					for N in networks:
+						try:
+							N.routePayment(a, b, amount)
+							routed.append(True)
+						except CN.CreditError:
+							routed.append(False)
+					self.assertEqual(routed, [routed[0]] * len(routed))
+				edges = sorted(networks[0].allEdges())
+				for N in networks[1:]:
+					self.assertEqual(sorted(N.allEdges()), edges)
+
+	def test_payoffs(self):
+		for credit_network in ["CreditNetwork", "ArrayCreditNetwork"]:
+			payoffs = [Simulator.simulate((parameters(credit_network= \
+					credit_network, num_banks=2, hubs=hubs, path_cache= \
+					path_cache), 0, 1))[0] for hubs in ["none", "banks", \
+					"detect"] for path_cache in [False, True]]
+			for p in payoffs[1:]:
+				self.assertEqual(p, payoffs[0])
+
+
+class TransactionsTest(unittest.TestCase):
+	def setUp(self):
+		R.seed(0)
+		self.TR = R.random_sample((6, 6))
+		self.TR[2] = 0
+
+	def draw(self, seed, chunk_size):
+		return list(CN.Transactions(self.TR, 1000, chunk_size, \
+				R.RandomState(seed)))
+
+	def test_chunk_size_does_not_change_draws(self):
+		pairs = self.draw(1, 10000)
+		self.assertEqual(len(pairs), 1000)
+		for chunk_size in [1, 7, 999, 1000]:
+			self.assertEqual(self.draw(1, chunk_size), pairs)
+		self.assertNotEqual(self.draw(2, 10000), pairs)
+
+	def test_only_rated_pairs_drawn(self):
+		for buyer, seller in self.draw(1, 64):
+			self.assertTrue(self.TR[buyer, seller] > 0)
+
+	def test_chunks(self):
+		chunks = list(CN.TransactionChunks(self.TR, 1000, 300, \
+				R.RandomState(1)))
+		self.assertEqual([len(buyers) for buyers, sellers in chunks], \
+				[300, 300, 300, 100])
+		self.assertEqual([pair for buyers, sellers in chunks for pair in \
+				zip(buyers.tolist(), sellers.tolist())], self.draw(1, 10000))
+
+
+class StreamCreditNetworkTest(unittest.TestCase):
+	def setUp(self):
+		self.p = parameters(num_banks=2)
+		R.seed(0)
+		self.matrices = CN.InitMatrices(self.p)
+		self.network = CN.BuildCrednet(CN.InitEdges(self.matrices, \
+				CN.InitSocialNetwork(self.p), self.p), self.p)
+		self.state = R.get_state()
+
+	def stream(self, every):
+		R.set_state(self.state)
+		return CN.StreamCreditNetwork(self.network.fork(), self.p, \
+				every=every, **self.matrices)
+
+	def test_snapshots(self):
+		R.set_state(self.state)
+		payoffs = CN.SimulateCreditNetwork(self.network.fork(), self.p, \
+				**self.matrices)
+		snapshots = list(self.stream(300))
+		self.assertEqual([s["events"] for s in snapshots], range(300, 2000, \
+				300) + [2000])
+		succeeded = [s["succeeded"] for s in snapshots]
+		self.assertEqual(succeeded, sorted(succeeded))
+		self.assertEqual(snapshots[-1]["payoffs"], payoffs)
+		self.assertNotEqual(snapshots[0]["payoffs"], payoffs)
+
+	def test_steady_state_truncates(self):
+		snapshots = list(CN.SteadyState(self.stream(100), float("inf"), 2))
+		self.assertEqual([s["events"] for s in snapshots], [100, 200, 300, \
+				400])
+		self.assertEqual(snapshots, list(self.stream(100))[:4])
+		self.assertEqual(len(list(CN.SteadyState(self.stream(100), -1))), 20)
+
+
+class BatchCreditNetworkTest(unittest.TestCase):
+	def test_lockstep(self):
+		rng = random.Random(7)
+		nodes = range(-2, 20)
+		networks = []
+		for r in range(6):
+			networks.append(CN.CreditNetwork(nodes, [(a, b, float( \
+					rng.randint(1, 3))) for a in nodes for b in nodes if a != \
+					b and rng.random() < 0.15]))
+			if r % 2:
+				networks[-1].removeNode(rng.choice(nodes))
+		batch = CN.BatchCreditNetwork(networks, nodes)
+		for step in range(500):
+			pairs = [rng.sample(nodes, 2) for N in networks]
+			amounts = [rng.choice([0.5, 1., 2., 5.]) for N in networks]
+			senders, receivers = zip(*pairs)
+			paid = batch.routePayments(senders, receivers, amounts)
+			for N, (sender, receiver), amount, batched in zip(networks, \
+					pairs, amounts, paid):
+				routed = sender in N.nodes and receiver in N.nodes
+				if routed:
+					try:
+						N.routePayment(sender, receiver, amount)
+					except CN.CreditError:
+						routed = False
+				self.assertEqual(batched, routed)
+		for r, N in enumerate(networks):
+			src, dst = batch.present[r].nonzero()
+			self.assertEqual([(batch.labels[i], batch.labels[j], \
+					batch.capacities[r, i, j]) for i, j in zip(src, dst)], \
+					sorted(N.allEdges()))
+
+
+class CheckpointTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def run_from(self, checkpoint, p, matrices):
+		network, payoffs = checkpoint.fork()
+		CN.SimulateTransactions(network, p, payoffs, matrices["TR"], \
+				matrices["BV"], matrices["SC"])
+		return payoffs, sorted(network.allEdges())
+
+	def test_save_load_fork(self):
+		for credit_network in ["CreditNetwork", "ArrayCreditNetwork"]:
+			p = parameters(credit_network=credit_network, num_banks=2)
+			R.seed(0)
+			matrices = CN.InitMatrices(p)
+			network = CN.BuildCrednet(CN.InitEdges(matrices, \
+					CN.InitSocialNetwork(p), p), p)
+			payoffs = dict.fromkeys(network.nodes, 0.)
+			CN.RemoveDefaulters(network, payoffs, CN.DrawDefaulters(network, \
+					p, matrices["DP"]))
+			checkpoint = CN.Checkpoint(network, payoffs)
+			path = os.path.join(self.directory, credit_network)
+			checkpoint.save(path)
+			expected = self.run_from(checkpoint, p, matrices)
+			self.assertEqual(self.run_from(CN.LoadCheckpoint(path), p, \
+					matrices), expected)
+			self.assertEqual(self.run_from(CN.LoadCheckpoint(path, None), p, \
+					matrices), expected)
+			self.assertEqual(self.run_from(checkpoint, p, matrices), expected)
+
+	def test_read_only(self):
+		network = CN.ArrayCreditNetwork(range(3), [(0, 1, 2.), (1, 2, 2.)])
+		network.save(self.directory)
+		loaded = CN.LoadCrednet(self.directory, "r")
+		self.assertRaises(CN.ReadOnlyError, loaded.routePayment, 2, 0, 1.)
+		self.assertRaises(CN.ReadOnlyError, loaded.addEdge, 2, 0, 1.)
+		self.assertRaises(CN.ReadOnlyError, loaded.removeEdge, 0, 1)
+		self.assertRaises(CN.ReadOnlyError, loaded.removeNode, 1)
+		fork = loaded.fork()
+		fork.routePayment(2, 0, 1.)
+		self.assertEqual(fork.allEdges(), [(0, 1, 1.), (1, 0, 1.), \
+				(1, 2, 1.), (2, 1, 1.)])
+		self.assertEqual(loaded.allEdges(), network.allEdges())
+
+
+if __name__ == "__main__":
+	unittest.main()
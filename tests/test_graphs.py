@@ -0,0 +1,105 @@
+import unittest
+from functools import partial
+
+import Graphs.Graphs as G
+import Graphs.GraphGenerators as GG
+import numpy.random as R
+from Strategies import AgentStrategies
+from helpers import parameters
+
+
+class DistanceTest(unittest.TestCase):
+	def setUp(self):
+		R.seed(0)
+		self.graph = GG.ErdosRenyiGraph(60, 0.05)
+		self.compact = G.CompactGraph(range(60), self.graph.iterEdges())
+
+	def test_rows(self):
+		for cutoff in [None, 0, 1, 3]:
+			matrix = self.graph.distanceMatrix(cutoff)
+			for source in range(60):
+				self.assertEqual(self.compact.distanceRow(source, \
+						cutoff).tolist(), matrix[source].tolist())
+
+	def test_def_prob_without_matrix(self):
+		def refuse(cutoff=None):
+			raise AssertionError("distanceMatrix called")
+		p = parameters(def_samples="0,20,inf,3")
+		matrices = {"DP":R.random_sample(60)}
+		estimates = []
+		for graph in [self.graph, self.compact]:
+			R.seed(1)
+			estimates.append(AgentStrategies(matrices, graph, p). \
+					DefProbMatrix())
+			self.compact.distanceMatrix = refuse
+		self.assertEqual(estimates[0].tolist(), estimates[1].tolist())
+
+
+class BidirectionalPathTest(unittest.TestCase):
+	def test_fewest_hops(self):
+		R.seed(4)
+		# sparse enough that some pairs are unreachable
+		undirected = GG.ErdosRenyiGraph(40, 0.04)
+		for graph in [undirected, GG.RandomEdgeDirections(undirected)]:
+			unreachable = 0
+			for origin in range(40):
+				for destination in range(40):
+					try:
+						hops = len(graph.bfsPath(origin, destination))
+					except G.PathError:
+						unreachable += 1
+						self.assertRaises(G.PathError, graph.bidirectionalPath, \
+								origin, destination)
+						continue
+					path = graph.bidirectionalPath(origin, destination)
+					self.assertEqual(len(path), hops)
+					self.assertEqual((path[0], path[-1]), (origin, destination))
+					for n1, n2 in zip(path, path[1:]):
+						self.assertTrue(graph.adjacent(n1, n2))
+			self.assertGreater(unreachable, 0)
+
+
+class GeneratorTest(unittest.TestCase):
+	def connected(self, graph):
+		return (graph.distanceMatrix() >= 0).all()
+
+	def test_erdos_renyi_edge_count(self):
+		n, p = 400, 0.02
+		expected = n * (n-1) / 2 * p
+		for seed in range(5):
+			R.seed(seed)
+			edges = GG.ErdosRenyiGraph(n, p).numEdges()
+			self.assertLess(abs(edges - expected), 5 * (expected * (1-p))**.5)
+
+	def test_barabasi_albert_attachments(self):
+		n, d = 200, 3
+		R.seed(0)
+		graph = GG.BarabasiAlbertGraph(n, d)
+		for node in range(n):
+			self.assertEqual(len([neighbor for neighbor in graph.neighbors( \
+					node) if neighbor < node]), min(d, node))
+		self.assertEqual(graph.numEdges(), sum(min(d, node) for node in \
+				range(n)))
+		self.assertTrue(self.connected(graph))
+
+	def test_spanning_tree(self):
+		for n in [1, 2, 50]:
+			R.seed(n)
+			graph = GG.UniformSpanningTree(n)
+			self.assertEqual(graph.numEdges(), n - 1)
+			self.assertTrue(self.connected(graph))
+
+	def test_graph_class(self):
+		for generator in [partial(GG.ErdosRenyiGraph, p=0.05), partial( \
+				GG.BarabasiAlbertGraph, d=2), GG.UniformSpanningTree]:
+			graphs = []
+			for graph in [G.UndirectedGraph, G.CompactGraph]:
+				R.seed(2)
+				graphs.append(generator(80, graph=graph))
+				self.assertIsInstance(graphs[-1], graph)
+			self.assertEqual(sorted(graphs[0].iterEdges()), \
+					sorted(graphs[1].iterEdges()))
+
+
+if __name__ == "__main__":
+	unittest.main()
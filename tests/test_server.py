@@ -0,0 +1,90 @@
+import unittest
+import subprocess
+import shutil
+import socket
+import stat
+import json
+import sys
+import os
+from tempfile import mkdtemp
+from time import time, sleep
+
+import SimulatorClient
+from helpers import configuration
+
+
+class SimulatorServerTest(unittest.TestCase):
+	"""Jobs sent to a server started for the test, on its own socket."""
+
+	def setUp(self):
+		self.directory = mkdtemp()
+		self.socket = os.path.join(self.directory, "simulator.sock")
+		with open(os.devnull, "w") as devnull:
+			self.server = subprocess.Popen([sys.executable, \
+					SimulatorClient.SERVER, "--socket", self.socket, \
+					"--idle-timeout", "60"], stdout=devnull, stderr=devnull)
+		deadline = time() + SimulatorClient.START_TIMEOUT
+		while True:
+			try:
+				SimulatorClient.connect(self.socket).close()
+				break
+			except socket.error:
+				self.assertLess(time(), deadline, "server did not start")
+				sleep(0.05)
+
+	def tearDown(self):
+		self.server.kill()
+		self.server.wait()
+		shutil.rmtree(self.directory)
+
+	def job(self, name, *argv):
+		"""Run Simulator.py on a small spec in its own folder."""
+		folder = os.path.join(self.directory, name)
+		os.mkdir(folder)
+		with open(os.path.join(folder, "simulation_spec.json"), "w") as f:
+			json.dump({"assignment":{"All":["BuyRate_highest2_get2", \
+					"DefProb_lowest2_get2"] * 5}, "configuration": \
+					configuration(events="200", sims_per_sample="2")}, f)
+		reply = SimulatorClient.submit([folder, "1"] + list(argv), \
+				self.socket)
+		self.assertEqual(reply["status"], 0, reply["output"])
+		with open(os.path.join(folder, "observation_0.json")) as f:
+			return json.load(f)
+
+	def test_unseeded_jobs_differ(self):
+		first, second = self.job("first"), self.job("second")
+		self.assertNotEqual(first["features"]["seed"], second["features"][ \
+				"seed"])
+		self.assertNotEqual(first["players"], second["players"])
+
+	def test_seeded_jobs_repeat(self):
+		self.assertEqual(self.job("first", "--seed", "4"), self.job("second", \
+				"--seed", "4"))
+
+
+class SocketPathTest(unittest.TestCase):
+	def setUp(self):
+		self.environment = dict(os.environ)
+		self.directory = mkdtemp()
+		os.environ["XDG_RUNTIME_DIR"] = self.directory
+
+	def tearDown(self):
+		os.environ.clear()
+		os.environ.update(self.environment)
+		shutil.rmtree(self.directory)
+
+	def test_private_directory(self):
+		path = SimulatorClient.socket_path()
+		self.assertEqual(os.path.dirname(os.path.dirname(path)), \
+				self.directory)
+		self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)). \
+				st_mode), 0700)
+		self.assertEqual(SimulatorClient.socket_path(), path)
+
+	def test_open_directory_refused(self):
+		os.chmod(os.path.dirname(SimulatorClient.socket_path()), 0755)
+		self.assertRaises(IOError, SimulatorClient.socket_path)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+import shutil
+import json
+import sys
+import os
+from tempfile import mkdtemp
+
+import Simulator
+from helpers import configuration, parameters
+
+
+class BatchTest(unittest.TestCase):
+	def test_batches_match_single_runs(self):
+		for social_network, num_banks in [("EmptyGraph", 2), \
+				("ErdosRenyiGraph", 0)]:
+			p = parameters(social_network=social_network, num_banks=num_banks, \
+					events=500, batch_size=3, deviations=[(0, \
+					"DefProb_lowest2_get2"), (1, "all0")])
+			tasks = [(p, sample, sim) for sample in range(2) for sim in \
+					range(2)]
+			self.assertEqual(Simulator.simulate_batch(tasks), \
+					map(Simulator.simulate_deviations, tasks))
+
+
+class RunSamplesTest(unittest.TestCase):
+	def test_workers(self):
+		p = parameters(samples=2, sims_per_sample=3, events=500, deviations= \
+				[(0, "all0")])
+		self.assertEqual(list(Simulator.run_samples(dict(p, workers=2))), \
+				list(Simulator.run_samples(dict(p, workers=1))))
+
+	def test_samples_required(self):
+		with open(os.devnull, "w") as devnull:
+			stderr, sys.stderr = sys.stderr, devnull
+			try:
+				self.assertRaises(SystemExit, Simulator.parse_args, \
+						["jsons"])
+			finally:
+				sys.stderr = stderr
+
+
+class WorldCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_cached_worlds_match(self):
+		p = parameters(workers=1, samples=2, sims_per_sample=2, events=500, \
+				social_network="ErdosRenyiGraph", deviations=[(0, "all0")])
+		other = dict(p, strategies=["all1"] * 40)
+		runs = [list(Simulator.run_samples(p)), list(Simulator.run_samples( \
+				other))]
+		cached = dict(p, world_cache=self.directory)
+		self.assertEqual(list(Simulator.run_samples(cached)), runs[0])
+		files = sorted(os.walk(self.directory))
+		self.assertEqual(len(files[1][2]), 4)
+		# a second profile of the same size reads the first profile's worlds
+		self.assertEqual(list(Simulator.run_samples(dict(other, world_cache= \
+				self.directory))), runs[1])
+		self.assertEqual(sorted(os.walk(self.directory)), files)
+
+
+class AdaptiveSampleTest(unittest.TestCase):
+	def test_max_sims_validated(self):
+		self.assertRaises(ValueError, Simulator.parse_config, \
+				configuration(max_sims_per_sample="0"))
+
+	def test_infinite_widths_are_null(self):
+		p = parameters(workers=1, deviations=[], tolerance=0.01, \
+				max_sims_per_sample=1, events=200)
+		results, features = Simulator.adaptive_sample(p, 0, None)
+		self.assertEqual(len(results), 1)
+		self.assertEqual(features["ci_half_width"], None)
+		self.assertEqual(set(features["ci_half_widths"].values()), set([None]))
+		self.assertNotIn("Infinity", json.dumps(features))
+
+
+class ObservationStreamTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def spec_folder(self, name):
+		"""Write a small spec into a folder of the temporary directory."""
+		folder = os.path.join(self.directory, name)
+		if not os.path.exists(folder):
+			os.mkdir(folder)
+		with open(os.path.join(folder, "simulation_spec.json"), "w") as f:
+			json.dump({"assignment":{"All":["BuyRate_highest2_get2", \
+					"DefProb_lowest2_get2"] * 5}, "configuration": \
+					configuration(events="200", sims_per_sample="2")}, f)
+		return folder
+
+	def run_main(self, name, *argv):
+		"""Run Simulator.main on two samples of the small spec."""
+		folder = self.spec_folder(name)
+		Simulator.main([folder, "2", "--seed", "5"] + list(argv))
+		return folder
+
+	def observations(self, folder):
+		observations = []
+		for i in range(2):
+			with open(os.path.join(folder, "observation_%d.json" % i)) as f:
+				observations.append(json.load(f))
+		return observations
+
+	def test_export_matches_files(self):
+		files = self.run_main("files")
+		stream = self.run_main("stream", "--format", "ndjson", \
+				"--sync-every", "1")
+		self.assertEqual(sorted(os.listdir(stream)), [Simulator.STREAM_FILE, \
+				"simulation_spec.json"])
+		self.assertEqual([name for name, payoff_json in \
+				Simulator.read_observations(stream)], ["0", "1"])
+		Simulator.main([stream, "--export"])
+		self.assertEqual(self.observations(stream), self.observations(files))
+
+	def test_drawn_seed_recorded(self):
+		drawn = self.spec_folder("drawn")
+		Simulator.main([drawn, "2"])
+		drawn = self.observations(drawn)
+		seed = drawn[0]["features"]["seed"]
+		self.assertEqual(drawn[1]["features"]["seed"], seed)
+		repeated = self.spec_folder("repeated")
+		Simulator.main([repeated, "2", "--seed", str(seed)])
+		self.assertEqual(self.observations(repeated), drawn)
+
+	def test_append_after_torn_write(self):
+		files = self.run_main("files")
+		stream = self.run_main("stream", "--format", "ndjson")
+		path = os.path.join(stream, Simulator.STREAM_FILE)
+		with open(path) as f:
+			size = len(f.readline()) + 20
+		with open(path, "r+") as f:
+			f.truncate(size)
+		self.run_main("stream", "--format", "ndjson")
+		self.assertEqual([name for name, payoff_json in \
+				Simulator.read_observations(stream)], ["0", "0", "1"])
+		Simulator.main([stream, "--export"])
+		self.assertEqual(self.observations(stream), self.observations(files))
+
+	def test_drop_torn_line(self):
+		path = os.path.join(self.directory, "lines")
+		for text, kept in [("a\nbc\n", "a\nbc\n"), ("a\nbcdefgh", "a\n"), \
+				("abcdefgh", ""), ("", "")]:
+			with open(path, "w") as f:
+				f.write(text)
+			Simulator.drop_torn_line(path, 3)
+			with open(path) as f:
+				self.assertEqual(f.read(), kept)
+
+	def test_cut_line_skipped(self):
+		stream = Simulator.ObservationStream(self.directory)
+		stream.write("0", {"players":[]})
+		stream.close()
+		with open(os.path.join(self.directory, Simulator.STREAM_FILE), \
+				"a") as f:
+			f.write('{"players":[], "obs')
+		self.assertEqual(list(Simulator.read_observations(self.directory)), \
+				[("0", {"players":[]})])
+
+
+if __name__ == "__main__":
+	unittest.main()
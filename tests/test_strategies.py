@@ -0,0 +1,54 @@
+import unittest
+import random
+
+import numpy.random as R
+import Graphs.Graphs as G
+from Strategies import AgentStrategies
+
+
+class VectorizedStrategiesTest(unittest.TestCase):
+	"""Matrix strategies choose the pairwise strategies' edges."""
+
+	criteria = ["Index", "TrueDefProb", "DefProb", "BuyRate", "BuyValue", \
+			"TradeValue", "SellRate", "SellCost", "TradeCost", "TradeProfit"]
+
+	def setUp(self):
+		R.seed(1)
+		n = 30
+		# values on a coarse grid, so many ties fall at each cutoff
+		self.matrices = {"DP":R.randint(0, 4, n) / 4., "TR":R.randint(0, 3, \
+				(n, n)) / 2., "BV":R.randint(1, 3, (n, n)) * 1., "SC": \
+				R.randint(1, 3, (n, n)) * 1.}
+		rng = random.Random(1)
+		self.social_network = G.UndirectedGraph(range(n), [(a, b) for a in \
+				range(n) for b in range(a) if rng.random() < 0.06])
+
+	def strategies(self, vectorized, def_samples):
+		return AgentStrategies(self.matrices, self.social_network, \
+				{"def_samples":def_samples, "def_alpha":1., "def_beta":9., \
+				"vectorized_strategies":vectorized})
+
+	def test_same_edges(self):
+		# DefProb is deterministic with only 0 and inf samples
+		for def_samples in ["inf", "inf,inf,0"]:
+			pairwise = self.strategies(False, def_samples)
+			vectorized = self.strategies(True, def_samples)
+			for criterion in self.criteria:
+				for choice in ["lowest0", "lowest1", "lowest5", "highest5", \
+						"highest28", "lowest29", "lowest40", "below0.5", \
+						"above0.5", "above1"]:
+					name = criterion + "_" + choice + "_get2"
+					for agent in range(30):
+						self.assertEqual(sorted(vectorized.get_strategy(name)( \
+								agent)), sorted(pairwise.get_strategy(name)( \
+								agent)), name)
+
+	def test_ties_go_to_lowest_nodes(self):
+		vectorized = self.strategies(True, "inf")
+		self.assertEqual(vectorized.get_strategy("DefProb_lowest3_get1")(0), \
+				[(0, n, 1.) for n in sorted(range(1, 30), key=lambda n: \
+				self.matrices["DP"][n])[:3]])
+
+
+if __name__ == "__main__":
+	unittest.main()
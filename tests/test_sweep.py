@@ -0,0 +1,55 @@
+import unittest
+import shutil
+import json
+import sys
+import os
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+import Sweep
+from helpers import configuration
+
+
+class RestartTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = mkdtemp()
+		self.spec = os.path.join(self.directory, "sweep_spec.json")
+		with open(self.spec, "w") as f:
+			json.dump({"assignment":{"All":["BuyRate_highest2_get2", \
+					"DefProb_lowest2_get2"] * 5}, "configuration": \
+					configuration(sims_per_sample="2"), \
+					"grid":{"price":["cost", "avg"], "events":[100, 200]}}, f)
+		self.output = os.path.join(self.directory, "output")
+		self.results = os.path.join(self.output, Sweep.RESULTS_FILE)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def sweep(self, *argv):
+		"""Run Sweep.main, returning the keys of the points it ran."""
+		stderr, sys.stderr = sys.stderr, StringIO()
+		try:
+			Sweep.main([self.spec, self.output, "2"] + list(argv))
+			return sys.stderr.getvalue().splitlines()
+		finally:
+			sys.stderr = stderr
+
+	def lines(self):
+		with open(self.results) as f:
+			return f.readlines()
+
+	def test_torn_point_redone(self):
+		keys = self.sweep("--seed", "5")
+		self.assertEqual(len(keys), 4)
+		lines = self.lines()
+		with open(self.results, "r+") as f:
+			f.truncate(len(lines[0]) + len(lines[1]) + 30)
+		self.assertEqual(Sweep.completed_points(self.output), set(keys[:2]))
+		self.assertEqual(self.lines(), lines[:2])
+		self.assertEqual(self.sweep(), keys[2:])
+		self.assertEqual(self.lines(), lines)
+		self.assertEqual(self.sweep(), [])
+
+
+if __name__ == "__main__":
+	unittest.main()